@@ -4,11 +4,44 @@ Script para popular o banco de dados com dados de teste
 """
 import asyncio
 from datetime import datetime, timedelta
-from bson import ObjectId
 from bson.decimal128 import Decimal128
 from src.config.settings import get_settings
 from src.infra.db.mongo import MongoProvider
 
+from seed_dividas import montar_divida, template_divida
+
+
+# Deslocamentos de data usados nas dívidas de teste
+_D15 = timedelta(days=15)
+_D30 = timedelta(days=30)
+_D45 = timedelta(days=45)
+_D60 = timedelta(days=60)
+_D90 = timedelta(days=90)
+
+# Valores monetários fixos, construídos uma única vez na importação
+_D_1500_00 = Decimal128("1500.00")
+_D_1650_00 = Decimal128("1650.00")
+_D_3000_00 = Decimal128("3000.00")
+_D_2800_00 = Decimal128("2800.00")
+_D_25000_00 = Decimal128("25000.00")
+_D_28000_00 = Decimal128("28000.00")
+
+# Dívidas de teste:
+# (tipo, descricao, valor_original, valor_atual, status, juros_mes, multa,
+#  deslocamento do vencimento, deslocamento da criação)
+_DIVIDAS_TESTE = (
+    ("cartao_credito", "Cartão de Crédito - Fatura Vencida",
+     _D_1500_00, _D_1650_00, "vencido", 2.5, 50.0, -_D15, -_D30),
+    ("emprestimo", "Empréstimo Pessoal",
+     _D_3000_00, _D_2800_00, "ativo", 1.8, 0.0, _D30, -_D60),
+    ("financiamento", "Financiamento Veículo",
+     _D_25000_00, _D_28000_00, "inadimplente", 1.2, 500.0, -_D45, -_D90),
+)
+
+
+_DIVIDA_TEMPLATES = [template_divida(*linha) for linha in _DIVIDAS_TESTE]
+
+
 async def populate_test_data():
     """Popula o banco com dados de teste"""
     # Usar configurações reais do ambiente
@@ -20,15 +53,16 @@ async def populate_test_data():
         db = mongo_provider.db
         
         print("🗑️  Limpando dados existentes...")
-        await db.clientes.delete_many({})
-        await db.dividas.delete_many({})
-        await db.boletos.delete_many({})
+        await asyncio.gather(
+            db.clientes.delete_many({}),
+            db.dividas.delete_many({}),
+            db.boletos.delete_many({}),
+        )
         
         print("👤 Criando cliente de teste...")
+        now = datetime.now()
         # Cliente de teste da requisição
-        cliente_id = ObjectId()
         cliente_data = {
-            "_id": cliente_id,
             "nome": "Larissa Brito",
             "cpf": "10799118397",
             "email": "larissa.brito@email.com",
@@ -44,68 +78,26 @@ async def populate_test_data():
             "status": "ativo",
             "score_credito": 650,
             "limite_credito": 5000.0,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": now,
+            "updated_at": now
         }
         
-        await db.clientes.insert_one(cliente_data)
+        resultado_cliente = await db.clientes.insert_one(cliente_data)
+        cliente_id = resultado_cliente.inserted_id
         print(f"✅ Cliente criado com ID: {cliente_id}")
         
         print("💰 Criando dívidas de teste...")
-        dividas_test = [
-            {
-                "_id": ObjectId(),
-                "cliente_id": cliente_id,
-                "tipo": "cartao_credito",
-                "descricao": "Cartão de Crédito - Fatura Vencida",
-                "valor_original": Decimal128("1500.00"),
-                "valor_atual": Decimal128("1650.00"),
-                "data_vencimento": datetime.now() - timedelta(days=15),
-                "dias_atraso": 15,
-                "status": "vencido",
-                "juros_mes": 2.5,
-                "multa": 50.0,
-                "created_at": datetime.now() - timedelta(days=30),
-                "updated_at": datetime.now()
-            },
-            {
-                "_id": ObjectId(),
-                "cliente_id": cliente_id,
-                "tipo": "emprestimo",
-                "descricao": "Empréstimo Pessoal",
-                "valor_original": Decimal128("3000.00"),
-                "valor_atual": Decimal128("2800.00"),
-                "data_vencimento": datetime.now() + timedelta(days=30),
-                "dias_atraso": 0,
-                "status": "ativo",
-                "juros_mes": 1.8,
-                "multa": 0.0,
-                "created_at": datetime.now() - timedelta(days=60),
-                "updated_at": datetime.now()
-            },
-            {
-                "_id": ObjectId(),
-                "cliente_id": cliente_id,
-                "tipo": "financiamento",
-                "descricao": "Financiamento Veículo",
-                "valor_original": Decimal128("25000.00"),
-                "valor_atual": Decimal128("28000.00"),
-                "data_vencimento": datetime.now() - timedelta(days=45),
-                "dias_atraso": 45,
-                "status": "inadimplente",
-                "juros_mes": 1.2,
-                "multa": 500.0,
-                "created_at": datetime.now() - timedelta(days=90),
-                "updated_at": datetime.now()
-            }
-        ]
+        dividas_test = [montar_divida(t, cliente_id, now) for t in _DIVIDA_TEMPLATES]
         
-        for divida in dividas_test:
-            await db.dividas.insert_one(divida)
-            print(f"✅ Dívida criada: {divida['tipo']} - R$ {divida['valor_atual'].to_decimal()}")
+        # Lote pequeno e confirmado: a verificação abaixo precisa enxergá-lo
+        await db.dividas.insert_many(dividas_test, ordered=False)
+        valores = [divida["valor_atual"].to_decimal() for divida in dividas_test]
+        for divida, valor in zip(dividas_test, valores):
+            print(f"✅ Dívida criada: {divida['tipo']} - R$ {valor}")
         
         print("\n🎉 Dados de teste criados com sucesso!")
         print(f"Cliente: {cliente_data['nome']} (CPF: {cliente_data['cpf']})")
+        # insert_many não devolve ids de RawBSONDocument sem _id; conta os enviados
         print(f"Total de dívidas: {len(dividas_test)}")
         
         # Verifica os dados criados
@@ -113,18 +105,17 @@ async def populate_test_data():
         cliente_encontrado = await db.clientes.find_one({"cpf": "10799118397"})
         print(f"Cliente encontrado: {cliente_encontrado['nome'] if cliente_encontrado else 'Não encontrado'}")
         
-        dividas_encontradas = await db.dividas.find({"cliente_id": cliente_id}).to_list(length=100)
-        print(f"Dívidas encontradas: {len(dividas_encontradas)}")
-        
-        for divida in dividas_encontradas:
+        total_dividas = 0
+        async for divida in db.dividas.find({"cliente_id": cliente_id}):
+            total_dividas += 1
             print(f"  - {divida['tipo']}: R$ {divida['valor_atual'].to_decimal()} ({divida['status']})")
+        print(f"Dívidas encontradas: {total_dividas}")
             
     except Exception as e:
         print(f"❌ Erro ao popular dados: {e}")
         
     finally:
-        if mongo_provider:
-            await mongo_provider.disconnect()
+        await mongo_provider.disconnect()
 
 if __name__ == "__main__":
     asyncio.run(populate_test_data())
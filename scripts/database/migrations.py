@@ -4,15 +4,20 @@ MongoDB Migration Manager
 Gerencia migrações e versionamento do schema do banco
 """
 
+import asyncio
 import os
 import sys
-from typing import Dict, List, Optional, Callable
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterator, List, Optional, Callable, Tuple
 from datetime import datetime, timezone
 import logging
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import json
-from pathlib import Path
+
+from schema_patterns import CPF_PATTERN
+
+# pymongo/motor são importados sob demanda: a ajuda da CLI não precisa deles
+if TYPE_CHECKING:
+    from pymongo import IndexModel
 
 # Configuração de logging
 logging.basicConfig(
@@ -21,22 +26,352 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+
+def version_key(version: str) -> Tuple[int, ...]:
+    """Converte "001" / "1.2" em tupla de inteiros para comparação numérica"""
+    return tuple(int(part) for part in version.split("."))
+
+
+def _canonical_validator(schema: Dict) -> Dict:
+    """Normaliza o validator (chaves ordenadas) para up/down enviarem o mesmo documento"""
+    return json.loads(json.dumps(schema, sort_keys=True))
+
+
+@lru_cache(maxsize=8)
+def _clientes_validator(statuses: Tuple[str, ...]) -> Dict:
+    """Validator $jsonSchema da coleção clientes para os status permitidos"""
+    return _canonical_validator({
+        "$jsonSchema": {
+            "bsonType": "object",
+            "required": ["cpf", "nome", "email", "status", "created_at"],
+            "properties": {
+                "cpf": {"bsonType": "string", "pattern": CPF_PATTERN},
+                "nome": {"bsonType": "string", "minLength": 2},
+                "email": {"bsonType": "string"},
+                "status": {"bsonType": "string", "enum": list(statuses)},
+                "created_at": {"bsonType": "date"}
+            }
+        }
+    })
+
+
+async def _clientes_status_enum(db) -> List[str]:
+    """Lê o enum de status do validator atual da coleção clientes"""
+    cursor = await db.list_collections(filter={"name": "clientes"})
+    async for info in cursor:
+        schema = info.get("options", {}).get("validator", {}).get("$jsonSchema", {})
+        return schema.get("properties", {}).get("status", {}).get("enum", [])
+    return []
+
+
+# createIndexes só aceita commitQuorum a partir do MongoDB 4.4
+_COMMIT_QUORUM_MIN_WIRE_VERSION = 9
+
+
+async def _create_indexes(collection, indexes: List["IndexModel"]) -> None:
+    """Cria os índices sem bloquear escritas na coleção
+
+    background=True vale para servidores < 4.2 (nos mais novos o build já é
+    híbrido); em replica sets >= 4.4 o build é coordenado entre os membros
+    votantes (servidores anteriores rejeitam commitQuorum).
+    """
+    for index in indexes:
+        index.document.setdefault("background", True)
+    kwargs = {}
+    topology = collection.database.client.topology_description
+    if topology.topology_type_name.startswith("ReplicaSet"):
+        # Menor versão de protocolo entre os membros conhecidos
+        wire_version = min(
+            (server.max_wire_version for server in topology.known_servers), default=0
+        )
+        if wire_version >= _COMMIT_QUORUM_MIN_WIRE_VERSION:
+            kwargs["commitQuorum"] = "votingMembers"
+    await collection.create_indexes(indexes, **kwargs)
+
+
+async def _create_collection(db, name: str, **kwargs) -> bool:
+    """Cria a coleção sem consultar listCollections; retorna False se já existir"""
+    from pymongo.errors import CollectionInvalid, OperationFailure
+    
+    try:
+        await db.create_collection(name, check_exists=False, **kwargs)
+    except CollectionInvalid:
+        return False
+    except OperationFailure as e:
+        if e.code != 48:  # NamespaceExists
+            raise
+        return False
+    return True
+
+
 class Migration:
     """Classe base para migrações"""
     
     def __init__(self, version: str, description: str):
         self.version = version
         self.description = description
-        self.created_at = datetime.now(timezone.utc)
+        self.version_key = version_key(version)
+        self._created_at: Optional[datetime] = None
     
-    def up(self, db):
+    @property
+    def created_at(self) -> datetime:
+        """Instante de criação, calculado só quando consultado"""
+        if self._created_at is None:
+            self._created_at = datetime.now(timezone.utc)
+        return self._created_at
+    
+    async def up(self, db):
         """Aplica a migração"""
         raise NotImplementedError("Método up deve ser implementado")
     
-    def down(self, db):
+    async def down(self, db):
         """Reverte a migração"""
         raise NotImplementedError("Método down deve ser implementado")
 
+
+# Migration 001: Estrutura inicial
+class InitialStructure(Migration):
+    def __init__(self):
+        super().__init__(
+            version="001",
+            description="Criação da estrutura inicial de coleções"
+        )
+    
+    async def up(self, db):
+        from pymongo import ASCENDING, IndexModel
+        
+        logger.info("🏗️  Criando estrutura inicial...")
+        
+        # Cria coleção de clientes com validação
+        if await _create_collection(db, "clientes", validator=_clientes_validator(("ativo", "inativo"))):
+            await _create_indexes(db.clientes, [
+                IndexModel([("cpf", ASCENDING)], unique=True),
+                IndexModel([("email", ASCENDING)], unique=True)
+            ])
+    
+    async def down(self, db):
+        logger.info("🗑️  Removendo estrutura inicial...")
+        await db.drop_collection("clientes")
+
+
+# Migration 002: Adiciona coleção de pagamentos
+class AddPayments(Migration):
+    def __init__(self):
+        super().__init__(
+            version="002", 
+            description="Adiciona coleção de pagamentos"
+        )
+    
+    async def up(self, db):
+        from pymongo import ASCENDING, IndexModel
+        
+        logger.info("💰 Criando coleção de pagamentos...")
+        
+        if await _create_collection(db, "pagamentos", validator={
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["cliente_id", "valor", "status", "created_at"],
+                "properties": {
+                    "cliente_id": {"bsonType": "objectId"},
+                    "valor": {"bsonType": "decimal"},
+                    "status": {"bsonType": "string", "enum": ["pendente", "pago", "cancelado"]},
+                    "created_at": {"bsonType": "date"}
+                }
+            }
+        }):
+            await _create_indexes(db.pagamentos, [
+                IndexModel([("cliente_id", ASCENDING)]),
+                IndexModel([("status", ASCENDING)]),
+                IndexModel([("created_at", ASCENDING)])
+            ])
+    
+    async def down(self, db):
+        logger.info("🗑️  Removendo coleção de pagamentos...")
+        await db.drop_collection("pagamentos")
+
+
+# Migration 003: Adiciona campo status bloqueado
+class AddBlockedStatus(Migration):
+    def __init__(self):
+        super().__init__(
+            version="003",
+            description="Adiciona status 'bloqueado' para clientes"
+        )
+    
+    async def up(self, db):
+        logger.info("🔒 Adicionando status 'bloqueado'...")
+        
+        # Re-execução após falha parcial: o validator já aceita o status
+        if "bloqueado" in await _clientes_status_enum(db):
+            logger.info("ℹ️  Validator de clientes já contém 'bloqueado'")
+            return
+        
+        # Atualiza o validator da coleção clientes
+        await db.command({
+            "collMod": "clientes",
+            "validator": _clientes_validator(("ativo", "inativo", "bloqueado"))
+        })
+    
+    async def down(self, db):
+        logger.info("🔓 Removendo status 'bloqueado'...")
+        
+        # Remove clientes com status bloqueado (filtro coberto pelo índice parcial da 006, se existir)
+        await db.clientes.update_many(
+            {"status": "bloqueado"}, 
+            {"$set": {"status": "inativo"}}
+        )
+        
+        # Volta o validator original (se ainda não foi revertido)
+        if "bloqueado" not in await _clientes_status_enum(db):
+            return
+        await db.command({
+            "collMod": "clientes",
+            "validator": _clientes_validator(("ativo", "inativo"))
+        })
+
+
+# Migration 004: Adiciona coleção de boletos
+class AddBoletos(Migration):
+    def __init__(self):
+        super().__init__(
+            version="004",
+            description="Adiciona coleção de boletos"
+        )
+    
+    async def up(self, db):
+        from pymongo import ASCENDING, IndexModel
+        
+        logger.info("🧾 Criando coleção de boletos...")
+        
+        if await _create_collection(db, "boletos", validator={
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["numero_boleto", "cliente_id", "valor", "status", "created_at"],
+                "properties": {
+                    "numero_boleto": {"bsonType": "string"},
+                    "cliente_id": {"bsonType": "objectId"},
+                    "pagamento_id": {"bsonType": "objectId"},
+                    "valor": {"bsonType": "decimal"},
+                    "data_vencimento": {"bsonType": "date"},
+                    "status": {"bsonType": "string", "enum": ["ativo", "pago", "cancelado", "vencido"]},
+                    "created_at": {"bsonType": "date"}
+                }
+            }
+        }):
+            await _create_indexes(db.boletos, [
+                IndexModel([("numero_boleto", ASCENDING)], unique=True),
+                IndexModel([("cliente_id", ASCENDING)]),
+                IndexModel([("status", ASCENDING)])
+            ])
+    
+    async def down(self, db):
+        logger.info("🗑️  Removendo coleção de boletos...")
+        await db.drop_collection("boletos")
+
+
+# Migration 005: Adiciona auditoria e usuários
+class AddAuditAndUsers(Migration):
+    def __init__(self):
+        super().__init__(
+            version="005",
+            description="Adiciona auditoria e usuários"
+        )
+    
+    async def up(self, db):
+        logger.info("👥 Criando coleções de usuários e auditoria...")
+        
+        # As duas coleções são independentes: cria em paralelo
+        await asyncio.gather(
+            self._create_usuarios(db),
+            self._create_auditoria(db)
+        )
+    
+    async def _create_usuarios(self, db):
+        from pymongo import ASCENDING, IndexModel
+        
+        if await _create_collection(db, "usuarios", validator={
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["username", "email", "password_hash", "role", "status", "created_at"],
+                "properties": {
+                    "username": {"bsonType": "string", "minLength": 3},
+                    "email": {"bsonType": "string"},
+                    "password_hash": {"bsonType": "string"},
+                    "role": {"bsonType": "string", "enum": ["admin", "user", "readonly"]},
+                    "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
+                    "created_at": {"bsonType": "date"}
+                }
+            }
+        }):
+            await _create_indexes(db.usuarios, [
+                IndexModel([("username", ASCENDING)], unique=True),
+                IndexModel([("email", ASCENDING)], unique=True)
+            ])
+    
+    async def _create_auditoria(self, db):
+        from pymongo import ASCENDING, IndexModel
+        
+        if await _create_collection(db, "auditoria"):
+            await _create_indexes(db.auditoria, [
+                IndexModel([("acao", ASCENDING)]),
+                IndexModel([("created_at", ASCENDING)]),
+                IndexModel([("usuario_id", ASCENDING)])
+            ])
+    
+    async def down(self, db):
+        logger.info("🗑️  Removendo usuários e auditoria...")
+        await db.drop_collection("usuarios")
+        await db.drop_collection("auditoria")
+
+
+# Migration 006: Índice parcial de status de clientes
+class AddClientesStatusIndex(Migration):
+    INDEX_NAME = "status_nao_ativo"
+    
+    def __init__(self):
+        super().__init__(
+            version="006",
+            description="Índice parcial de status para clientes fora de 'ativo'"
+        )
+    
+    async def up(self, db):
+        from pymongo import ASCENDING, IndexModel
+        
+        logger.info("📇 Criando índice parcial de status em clientes...")
+        
+        # Só clientes fora de "ativo" ("bloqueado", "inativo"); $gt em vez de $in
+        # porque servidores < 6.0 não aceitam $in em filtros de índice parcial
+        await _create_indexes(db.clientes, [
+            IndexModel(
+                [("status", ASCENDING)],
+                name=self.INDEX_NAME,
+                partialFilterExpression={"status": {"$gt": "ativo"}}
+            )
+        ])
+    
+    async def down(self, db):
+        from pymongo.errors import OperationFailure
+        
+        logger.info("🗑️  Removendo índice parcial de status...")
+        try:
+            await db.clientes.drop_index(self.INDEX_NAME)
+        except OperationFailure as e:
+            if e.code not in (26, 27):  # NamespaceNotFound, IndexNotFound
+                raise
+
+
+# Registradas uma única vez na importação do módulo
+_REGISTERED_MIGRATIONS = tuple(sorted((
+    InitialStructure(),
+    AddPayments(),
+    AddBlockedStatus(),
+    AddBoletos(),
+    AddAuditAndUsers(),
+    AddClientesStatusIndex()
+), key=lambda m: m.version_key))
+
+
 class MigrationManager:
     """Gerenciador de migrações"""
     
@@ -46,18 +381,32 @@ class MigrationManager:
         self.client = None
         self.db = None
         self.migrations = []
+        # Versões aplicadas lidas do banco; invalidado a cada apply/rollback
+        self._applied_cache: Optional[FrozenSet[str]] = None
         self._register_migrations()
     
-    def connect(self) -> bool:
+    async def connect(self) -> bool:
         """Conecta ao MongoDB"""
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo.errors import ConnectionFailure
+        
         try:
-            self.client = MongoClient(self.connection_string)
-            self.client.admin.command('ping')
+            # Pool pequeno e timeouts curtos: execução curta com rajadas de DDL
+            self.client = AsyncIOMotorClient(
+                self.connection_string,
+                maxPoolSize=10,
+                minPoolSize=2,
+                maxConnecting=4,
+                connectTimeoutMS=5000,
+                socketTimeoutMS=30000,
+                serverSelectionTimeoutMS=5000,
+                appname="migrations"
+            )
+            await self.client.admin.command('ping')
             self.db = self.client[self.database_name]
             
             # Cria coleção de controle de migrações
-            if "migrations" not in self.db.list_collection_names():
-                self.db.create_collection("migrations")
+            if await _create_collection(self.db, "migrations"):
                 logger.info("📝 Coleção de migrações criada")
             
             return True
@@ -72,251 +421,52 @@ class MigrationManager:
     
     def _register_migrations(self):
         """Registra todas as migrações disponíveis"""
-        
-        # Migration 001: Estrutura inicial
-        class InitialStructure(Migration):
-            def __init__(self):
-                super().__init__(
-                    version="001",
-                    description="Criação da estrutura inicial de coleções"
-                )
-            
-            def up(self, db):
-                logger.info("🏗️  Criando estrutura inicial...")
-                
-                # Cria coleção de clientes com validação
-                if "clientes" not in db.list_collection_names():
-                    db.create_collection("clientes", validator={
-                        "$jsonSchema": {
-                            "bsonType": "object",
-                            "required": ["cpf", "nome", "email", "status", "created_at"],
-                            "properties": {
-                                "cpf": {"bsonType": "string", "pattern": "^[0-9]{11}$"},
-                                "nome": {"bsonType": "string", "minLength": 2},
-                                "email": {"bsonType": "string"},
-                                "status": {"bsonType": "string", "enum": ["ativo", "inativo"]},
-                                "created_at": {"bsonType": "date"}
-                            }
-                        }
-                    })
-                    db.clientes.create_index("cpf", unique=True)
-                    db.clientes.create_index("email", unique=True)
-            
-            def down(self, db):
-                logger.info("🗑️  Removendo estrutura inicial...")
-                db.drop_collection("clientes")
-        
-        # Migration 002: Adiciona coleção de pagamentos
-        class AddPayments(Migration):
-            def __init__(self):
-                super().__init__(
-                    version="002", 
-                    description="Adiciona coleção de pagamentos"
-                )
-            
-            def up(self, db):
-                logger.info("💰 Criando coleção de pagamentos...")
-                
-                if "pagamentos" not in db.list_collection_names():
-                    db.create_collection("pagamentos", validator={
-                        "$jsonSchema": {
-                            "bsonType": "object",
-                            "required": ["cliente_id", "valor", "status", "created_at"],
-                            "properties": {
-                                "cliente_id": {"bsonType": "objectId"},
-                                "valor": {"bsonType": "decimal"},
-                                "status": {"bsonType": "string", "enum": ["pendente", "pago", "cancelado"]},
-                                "created_at": {"bsonType": "date"}
-                            }
-                        }
-                    })
-                    db.pagamentos.create_index("cliente_id")
-                    db.pagamentos.create_index("status")
-                    db.pagamentos.create_index("created_at")
-            
-            def down(self, db):
-                logger.info("🗑️  Removendo coleção de pagamentos...")
-                db.drop_collection("pagamentos")
-        
-        # Migration 003: Adiciona campo status bloqueado
-        class AddBlockedStatus(Migration):
-            def __init__(self):
-                super().__init__(
-                    version="003",
-                    description="Adiciona status 'bloqueado' para clientes"
-                )
-            
-            def up(self, db):
-                logger.info("🔒 Adicionando status 'bloqueado'...")
-                
-                # Atualiza o validator da coleção clientes
-                db.command({
-                    "collMod": "clientes",
-                    "validator": {
-                        "$jsonSchema": {
-                            "bsonType": "object",
-                            "required": ["cpf", "nome", "email", "status", "created_at"],
-                            "properties": {
-                                "cpf": {"bsonType": "string", "pattern": "^[0-9]{11}$"},
-                                "nome": {"bsonType": "string", "minLength": 2},
-                                "email": {"bsonType": "string"},
-                                "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
-                                "created_at": {"bsonType": "date"}
-                            }
-                        }
-                    }
-                })
-            
-            def down(self, db):
-                logger.info("🔓 Removendo status 'bloqueado'...")
-                
-                # Remove clientes com status bloqueado
-                db.clientes.update_many(
-                    {"status": "bloqueado"}, 
-                    {"$set": {"status": "inativo"}}
-                )
-                
-                # Volta o validator original
-                db.command({
-                    "collMod": "clientes",
-                    "validator": {
-                        "$jsonSchema": {
-                            "bsonType": "object",
-                            "required": ["cpf", "nome", "email", "status", "created_at"],
-                            "properties": {
-                                "cpf": {"bsonType": "string", "pattern": "^[0-9]{11}$"},
-                                "nome": {"bsonType": "string", "minLength": 2},
-                                "email": {"bsonType": "string"},
-                                "status": {"bsonType": "string", "enum": ["ativo", "inativo"]},
-                                "created_at": {"bsonType": "date"}
-                            }
-                        }
-                    }
-                })
-        
-        # Migration 004: Adiciona coleção de boletos
-        class AddBoletos(Migration):
-            def __init__(self):
-                super().__init__(
-                    version="004",
-                    description="Adiciona coleção de boletos"
-                )
-            
-            def up(self, db):
-                logger.info("🧾 Criando coleção de boletos...")
-                
-                if "boletos" not in db.list_collection_names():
-                    db.create_collection("boletos", validator={
-                        "$jsonSchema": {
-                            "bsonType": "object",
-                            "required": ["numero_boleto", "cliente_id", "valor", "status", "created_at"],
-                            "properties": {
-                                "numero_boleto": {"bsonType": "string"},
-                                "cliente_id": {"bsonType": "objectId"},
-                                "pagamento_id": {"bsonType": "objectId"},
-                                "valor": {"bsonType": "decimal"},
-                                "data_vencimento": {"bsonType": "date"},
-                                "status": {"bsonType": "string", "enum": ["ativo", "pago", "cancelado", "vencido"]},
-                                "created_at": {"bsonType": "date"}
-                            }
-                        }
-                    })
-                    db.boletos.create_index("numero_boleto", unique=True)
-                    db.boletos.create_index("cliente_id")
-                    db.boletos.create_index("status")
-            
-            def down(self, db):
-                logger.info("🗑️  Removendo coleção de boletos...")
-                db.drop_collection("boletos")
-        
-        # Migration 005: Adiciona auditoria e usuários
-        class AddAuditAndUsers(Migration):
-            def __init__(self):
-                super().__init__(
-                    version="005",
-                    description="Adiciona auditoria e usuários"
-                )
-            
-            def up(self, db):
-                logger.info("👥 Criando coleções de usuários e auditoria...")
-                
-                # Coleção de usuários
-                if "usuarios" not in db.list_collection_names():
-                    db.create_collection("usuarios", validator={
-                        "$jsonSchema": {
-                            "bsonType": "object",
-                            "required": ["username", "email", "password_hash", "role", "status", "created_at"],
-                            "properties": {
-                                "username": {"bsonType": "string", "minLength": 3},
-                                "email": {"bsonType": "string"},
-                                "password_hash": {"bsonType": "string"},
-                                "role": {"bsonType": "string", "enum": ["admin", "user", "readonly"]},
-                                "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
-                                "created_at": {"bsonType": "date"}
-                            }
-                        }
-                    })
-                    db.usuarios.create_index("username", unique=True)
-                    db.usuarios.create_index("email", unique=True)
-                
-                # Coleção de auditoria
-                if "auditoria" not in db.list_collection_names():
-                    db.create_collection("auditoria")
-                    db.auditoria.create_index("acao")
-                    db.auditoria.create_index("created_at")
-                    db.auditoria.create_index("usuario_id")
-            
-            def down(self, db):
-                logger.info("🗑️  Removendo usuários e auditoria...")
-                db.drop_collection("usuarios")
-                db.drop_collection("auditoria")
-        
-        # Registra todas as migrações
-        self.migrations = [
-            InitialStructure(),
-            AddPayments(),
-            AddBlockedStatus(),
-            AddBoletos(),
-            AddAuditAndUsers()
-        ]
-    
-    def get_applied_migrations(self) -> List[str]:
+        self.migrations = _REGISTERED_MIGRATIONS
+        self._by_version = {m.version: m for m in self.migrations}
+    
+    async def get_applied_versions(self) -> FrozenSet[str]:
+        """Retorna o conjunto de versões já aplicadas"""
+        if self._applied_cache is None:
+            cursor = self.db.migrations.find({}, {"version": 1, "_id": 0})
+            self._applied_cache = frozenset([m["version"] async for m in cursor])
+        return self._applied_cache
+    
+    async def get_applied_migrations(self) -> List[str]:
         """Retorna lista de migrações já aplicadas"""
-        applied = list(self.db.migrations.find({}, {"version": 1}).sort("applied_at", 1))
-        return [m["version"] for m in applied]
+        return sorted(await self.get_applied_versions(), key=version_key)
     
-    def get_pending_migrations(self) -> List[Migration]:
-        """Retorna migrações pendentes"""
-        applied = self.get_applied_migrations()
-        return [m for m in self.migrations if m.version not in applied]
+    async def iter_pending(self) -> Iterator[Migration]:
+        """Retorna um iterador preguiçoso sobre as migrações pendentes"""
+        applied = await self.get_applied_versions()
+        return (m for m in self.migrations if m.version not in applied)
     
-    def apply_migration(self, migration: Migration) -> bool:
-        """Aplica uma migração específica"""
+    async def apply_migration(self, migration: Migration,
+                              applied_at: Optional[datetime] = None
+                              ) -> Tuple[bool, Optional[Dict]]:
+        """Aplica uma migração e retorna o registro a ser gravado em migrations"""
         try:
             logger.info(f"🚀 Aplicando migração {migration.version}: {migration.description}")
             
             # Aplica a migração
-            migration.up(self.db)
+            await migration.up(self.db)
             
-            # Registra a migração como aplicada
-            self.db.migrations.insert_one({
+            logger.info(f"✅ Migração {migration.version} aplicada com sucesso")
+            # O registro é gravado em lote por migrate_up
+            return True, {
                 "version": migration.version,
                 "description": migration.description,
-                "applied_at": datetime.now(timezone.utc)
-            })
-            
-            logger.info(f"✅ Migração {migration.version} aplicada com sucesso")
-            return True
+                "applied_at": applied_at or datetime.now(timezone.utc)
+            }
             
         except Exception as e:
             logger.error(f"❌ Erro ao aplicar migração {migration.version}: {e}")
-            return False
+            return False, None
     
-    def rollback_migration(self, version: str) -> bool:
+    async def rollback_migration(self, version: str) -> bool:
         """Reverte uma migração específica"""
         try:
             # Encontra a migração
-            migration = next((m for m in self.migrations if m.version == version), None)
+            migration = self._by_version.get(version)
             if not migration:
                 logger.error(f"❌ Migração {version} não encontrada")
                 return False
@@ -324,10 +474,11 @@ class MigrationManager:
             logger.info(f"⏪ Revertendo migração {version}: {migration.description}")
             
             # Reverte a migração
-            migration.down(self.db)
+            await migration.down(self.db)
             
             # Remove o registro da migração
-            self.db.migrations.delete_one({"version": version})
+            await self.db.migrations.delete_one({"version": version})
+            self._applied_cache = None
             
             logger.info(f"✅ Migração {version} revertida com sucesso")
             return True
@@ -336,12 +487,16 @@ class MigrationManager:
             logger.error(f"❌ Erro ao reverter migração {version}: {e}")
             return False
     
-    def migrate_up(self, target_version: Optional[str] = None) -> bool:
+    async def migrate_up(self, target_version: Optional[str] = None) -> bool:
         """Aplica todas as migrações pendentes até a versão alvo"""
-        pending = self.get_pending_migrations()
+        pending = await self.iter_pending()
         
         if target_version:
-            pending = [m for m in pending if m.version <= target_version]
+            target_key = version_key(target_version)
+            pending = (m for m in pending if m.version_key <= target_key)
+        
+        # Lista materializada uma única vez, necessária para o log de contagem
+        pending = list(pending)
         
         if not pending:
             logger.info("✅ Nenhuma migração pendente")
@@ -349,20 +504,34 @@ class MigrationManager:
         
         logger.info(f"📋 {len(pending)} migrações pendentes")
         
-        for migration in pending:
-            if not self.apply_migration(migration):
-                logger.error(f"❌ Falha na migração {migration.version}")
-                return False
+        from pymongo import InsertOne
+        
+        # Mesmo applied_at para todas as migrações desta execução
+        now = datetime.now(timezone.utc)
+        records = []
+        try:
+            for migration in pending:
+                ok, record = await self.apply_migration(migration, now)
+                if not ok:
+                    logger.error(f"❌ Falha na migração {migration.version}")
+                    return False
+                records.append(InsertOne(record))
+        finally:
+            # Registra as migrações aplicadas em um único bulk_write, mesmo após falha
+            if records:
+                await self.db.migrations.bulk_write(records, ordered=True)
+                self._applied_cache = None
         
         logger.info("🎉 Todas as migrações aplicadas com sucesso!")
         return True
     
-    def migrate_down(self, target_version: str) -> bool:
+    async def migrate_down(self, target_version: str) -> bool:
         """Reverte migrações até a versão alvo"""
-        applied = self.get_applied_migrations()
-        applied.reverse()  # Reverte na ordem inversa
+        # Reverte na ordem inversa
+        applied = sorted(await self.get_applied_migrations(), key=version_key, reverse=True)
         
-        to_rollback = [v for v in applied if v > target_version]
+        target_key = version_key(target_version)
+        to_rollback = [v for v in applied if version_key(v) > target_key]
         
         if not to_rollback:
             logger.info("✅ Nenhuma migração para reverter")
@@ -371,17 +540,19 @@ class MigrationManager:
         logger.info(f"📋 Revertendo {len(to_rollback)} migrações")
         
         for version in to_rollback:
-            if not self.rollback_migration(version):
+            if not await self.rollback_migration(version):
                 logger.error(f"❌ Falha ao reverter migração {version}")
                 return False
         
         logger.info("🎉 Reversão concluída com sucesso!")
         return True
     
-    def status(self):
+    async def status(self):
         """Mostra status das migrações"""
-        applied = self.get_applied_migrations()
-        pending = self.get_pending_migrations()
+        # Uma leitura do banco; versões aplicadas podem incluir migrações não registradas
+        applied_set = await self.get_applied_versions()
+        applied = sorted(applied_set, key=version_key)
+        pending = [m for m in self.migrations if m.version not in applied_set]
         
         print("\n📊 Status das Migrações:")
         print("=" * 50)
@@ -389,7 +560,7 @@ class MigrationManager:
         print("\n✅ Migrações Aplicadas:")
         if applied:
             for version in applied:
-                migration = next((m for m in self.migrations if m.version == version), None)
+                migration = self._by_version.get(version)
                 desc = migration.description if migration else "Descrição não encontrada"
                 print(f"  {version}: {desc}")
         else:
@@ -402,6 +573,42 @@ class MigrationManager:
         else:
             print("  Nenhuma migração pendente")
 
+async def run_command(manager: MigrationManager, args: List[str]):
+    """Conecta e executa o comando informado na linha de comando"""
+    if not await manager.connect():
+        print("❌ Não foi possível conectar ao banco")
+        return
+    
+    try:
+        command = args[0]
+        
+        if command == "status":
+            await manager.status()
+            
+        elif command == "up":
+            target_version = args[1] if len(args) > 1 else None
+            await manager.migrate_up(target_version)
+            
+        elif command == "down":
+            if len(args) < 2:
+                print("❌ Versão alvo necessária para 'down'")
+                return
+            target_version = args[1]
+            await manager.migrate_down(target_version)
+            
+        elif command == "rollback":
+            if len(args) < 2:
+                print("❌ Versão necessária para 'rollback'")
+                return
+            version = args[1]
+            await manager.rollback_migration(version)
+            
+        else:
+            print(f"❌ Comando '{command}' não reconhecido")
+    
+    finally:
+        manager.disconnect()
+
 def main():
     """Função principal"""
     print("🔄 MongoDB Migration Manager")
@@ -434,40 +641,7 @@ def main():
     
     # Inicializa o gerenciador
     manager = MigrationManager(connection_string)
-    
-    if not manager.connect():
-        print("❌ Não foi possível conectar ao banco")
-        return
-    
-    try:
-        command = sys.argv[1]
-        
-        if command == "status":
-            manager.status()
-            
-        elif command == "up":
-            target_version = sys.argv[2] if len(sys.argv) > 2 else None
-            manager.migrate_up(target_version)
-            
-        elif command == "down":
-            if len(sys.argv) < 3:
-                print("❌ Versão alvo necessária para 'down'")
-                return
-            target_version = sys.argv[2]
-            manager.migrate_down(target_version)
-            
-        elif command == "rollback":
-            if len(sys.argv) < 3:
-                print("❌ Versão necessária para 'rollback'")
-                return
-            version = sys.argv[2]
-            manager.rollback_migration(version)
-            
-        else:
-            print(f"❌ Comando '{command}' não reconhecido")
-    
-    finally:
-        manager.disconnect()
+    asyncio.run(run_command(manager, sys.argv[1:]))
 
 if __name__ == "__main__":
     main()
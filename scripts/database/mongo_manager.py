@@ -5,36 +5,300 @@ Gerencia a conexão, estrutura e organização do banco MongoDB na cloud
 """
 
 import os
+import re
+import shutil
 import sys
-from typing import Dict, List, Optional
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
 from datetime import datetime, timezone
 import logging
-from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING, CursorType, IndexModel, UpdateOne
 from pymongo.errors import ConnectionFailure, OperationFailure
+from bson import json_util
 import json
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from schema_patterns import CPF_PATTERN, EMAIL_PATTERN
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%dT%H:%M:%SZ'
 )
+# Horários em UTC: evita a consulta ao fuso local a cada registro
+for _handler in logging.getLogger().handlers:
+    if _handler.formatter is not None:
+        _handler.formatter.converter = time.gmtime
 logger = logging.getLogger(__name__)
 
+# Pool e timeouts do cliente; ajustáveis por variável de ambiente
+# (ex.: Atlas M10 vs. worker de carga pesada)
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", "5")),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000")),
+    "maxConnecting": int(os.getenv("MONGO_MAX_CONNECTING", "8")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000")),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000")),
+    # Compressores negociados com o servidor; zlib não exige dependência extra
+    # (zstd/snappy precisam de zstandard/python-snappy instalados)
+    "compressors": os.getenv("MONGO_COMPRESSORS", "zlib"),
+    "retryWrites": True,
+}
+
+# Documentos buscados por round-trip durante o backup
+BACKUP_BATCH_SIZE = 5000
+
+# Limite de coleções processadas em paralelo (backup/compactação)
+MAX_COLLECTION_WORKERS = 8
+
+# Quantidade de _ids (órfãos ou duplicados) removidos por delete_many
+DELETE_BATCH_SIZE = 1000
+
+# Validade do cache de nomes de coleções, em segundos
+COLLECTION_NAMES_TTL = 5.0
+
+# Instância compartilhada pelo processo (um MongoClient, um pool)
+_SHARED: Optional["MongoCloudManager"] = None
+_SHARED_LOCK = threading.Lock()
+
+def _bson_default(obj):
+    """Converte tipos BSON (ObjectId, datas, Decimal128...) para Extended JSON"""
+    return json_util.default(obj, json_util.RELAXED_JSON_OPTIONS)
+
+
+def _dumps_doc(doc: Mapping, pretty: bool = False) -> bytes:
+    """Serializa um documento do backup em Extended JSON (orjson quando disponível)"""
+    if orjson is not None:
+        # Datas passam pelo default para manter o formato {"$date": ...} do json_util
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(doc, default=_bson_default, option=option)
+    return json_util.dumps(
+        doc, json_options=json_util.RELAXED_JSON_OPTIONS,
+        ensure_ascii=False, indent=2 if pretty else None
+    ).encode("utf-8")
+
+
+# Retenção dos registros de auditoria (índice TTL em created_at)
+AUDITORIA_RETENTION_DAYS = int(os.getenv("AUDITORIA_RETENTION_DAYS", "180"))
+
+# Opções de índice repassadas do schema para o IndexModel
+_INDEX_OPTIONS = ("name", "unique", "expireAfterSeconds", "partialFilterExpression")
+
+# Padrões de CPF e e-mail, compilados uma vez; os mesmos textos vão para o
+# validador $jsonSchema, então a checagem local espelha a do servidor
+_CPF_RE = re.compile(CPF_PATTERN, re.ASCII)
+_EMAIL_RE = re.compile(EMAIL_PATTERN)
+
+
+def validate_client_doc(doc: Mapping) -> None:
+    """Valida CPF e e-mail de um cliente antes de enviá-lo ao banco (ValueError se inválido)"""
+    cpf = doc.get("cpf")
+    if not isinstance(cpf, str) or not _CPF_RE.fullmatch(cpf):
+        raise ValueError(f"CPF inválido: {cpf!r}")
+    email = doc.get("email")
+    if not isinstance(email, str) or not _EMAIL_RE.fullmatch(email):
+        raise ValueError(f"E-mail inválido: {email!r}")
+
+
+# Estrutura recomendada das coleções (índices e validadores), montada uma
+# única vez na importação e compartilhada, somente leitura, entre instâncias
+_COLLECTIONS_SCHEMA: Mapping[str, Mapping] = MappingProxyType({
+    "clientes": MappingProxyType({
+        "description": "Dados dos clientes",
+        "indexes": (
+            {"fields": [("cpf", ASCENDING)], "unique": True},
+            {"fields": [("email", ASCENDING)], "unique": True},
+            {"fields": [("created_at", DESCENDING)]},
+            {"fields": [("status", ASCENDING)]},
+            {"fields": [("cpf", "text"), ("nome", "text"), ("email", "text")]}
+        ),
+        "validator": {
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["cpf", "nome", "email", "status", "created_at"],
+                "properties": {
+                    "cpf": {"bsonType": "string", "maxLength": 11, "pattern": CPF_PATTERN},
+                    "nome": {"bsonType": "string", "minLength": 2},
+                    "email": {"bsonType": "string", "pattern": EMAIL_PATTERN},
+                    "telefone": {"bsonType": "string"},
+                    "endereco": {"bsonType": "object"},
+                    "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
+                    "created_at": {"bsonType": "date"},
+                    "updated_at": {"bsonType": "date"}
+                }
+            }
+        }
+    }),
+    
+    "pagamentos": MappingProxyType({
+        "description": "Histórico de pagamentos",
+        "indexes": (
+            {"fields": [("cliente_id", ASCENDING)]},
+            {"fields": [("status", ASCENDING)]},
+            {"fields": [("data_vencimento", ASCENDING)]},
+            {"fields": [("created_at", DESCENDING)]},
+            {"fields": [("valor", DESCENDING)]},
+            {"fields": [("tipo_pagamento", ASCENDING)]}
+        ),
+        "validator": {
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["cliente_id", "valor", "status", "tipo_pagamento", "created_at"],
+                "properties": {
+                    "cliente_id": {"bsonType": "objectId"},
+                    "valor": {"bsonType": "decimal"},
+                    "descricao": {"bsonType": "string"},
+                    "status": {"bsonType": "string", "enum": ["pendente", "pago", "cancelado", "vencido"]},
+                    "tipo_pagamento": {"bsonType": "string", "enum": ["boleto", "pix", "cartao"]},
+                    "data_vencimento": {"bsonType": "date"},
+                    "data_pagamento": {"bsonType": "date"},
+                    "created_at": {"bsonType": "date"},
+                    "updated_at": {"bsonType": "date"}
+                }
+            }
+        }
+    }),
+    
+    "boletos": MappingProxyType({
+        "description": "Boletos gerados",
+        "indexes": (
+            {"fields": [("numero_boleto", ASCENDING)], "unique": True},
+            {"fields": [("cliente_id", ASCENDING)]},
+            {"fields": [("pagamento_id", ASCENDING)]},
+            {"fields": [("status", ASCENDING)]},
+            {"fields": [("data_vencimento", ASCENDING)]},
+            {"fields": [("created_at", DESCENDING)]}
+        ),
+        "validator": {
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["numero_boleto", "cliente_id", "valor", "status", "created_at"],
+                "properties": {
+                    "numero_boleto": {"bsonType": "string"},
+                    "cliente_id": {"bsonType": "objectId"},
+                    "pagamento_id": {"bsonType": "objectId"},
+                    "valor": {"bsonType": "decimal"},
+                    "data_vencimento": {"bsonType": "date"},
+                    "linha_digitavel": {"bsonType": "string"},
+                    "codigo_barras": {"bsonType": "string"},
+                    "status": {"bsonType": "string", "enum": ["ativo", "pago", "cancelado", "vencido"]},
+                    "created_at": {"bsonType": "date"},
+                    "updated_at": {"bsonType": "date"}
+                }
+            }
+        }
+    }),
+    
+    "auditoria": MappingProxyType({
+        "description": "Log de auditoria do sistema",
+        "indexes": (
+            # Só ações de usuários autenticados entram no índice
+            {"fields": [("usuario_id", ASCENDING)], "name": "usuario_id_parcial",
+             "partialFilterExpression": {"usuario_id": {"$exists": True}},
+             "replaces": "usuario_id_1"},
+            {"fields": [("acao", ASCENDING)]},
+            # TTL: o servidor remove registros mais antigos que a retenção
+            # (substitui o created_at_1 simples criado pela migração 005)
+            {"fields": [("created_at", ASCENDING)], "name": "created_at_ttl",
+             "expireAfterSeconds": AUDITORIA_RETENTION_DAYS * 86400,
+             "replaces": "created_at_1"},
+            {"fields": [("ip_address", ASCENDING)]},
+            {"fields": [("recurso", ASCENDING)]}
+        ),
+        "validator": {
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["acao", "recurso", "created_at"],
+                "properties": {
+                    "usuario_id": {"bsonType": "objectId"},
+                    "acao": {"bsonType": "string"},
+                    "recurso": {"bsonType": "string"},
+                    "detalhes": {"bsonType": "object"},
+                    "ip_address": {"bsonType": "string"},
+                    "user_agent": {"bsonType": "string"},
+                    "created_at": {"bsonType": "date"}
+                }
+            }
+        }
+    }),
+    
+    "usuarios": MappingProxyType({
+        "description": "Usuários do sistema",
+        "indexes": (
+            {"fields": [("email", ASCENDING)], "unique": True},
+            {"fields": [("username", ASCENDING)], "unique": True},
+            {"fields": [("status", ASCENDING)]},
+            {"fields": [("role", ASCENDING)]},
+            {"fields": [("created_at", DESCENDING)]}
+        ),
+        "validator": {
+            "$jsonSchema": {
+                "bsonType": "object",
+                "required": ["username", "email", "password_hash", "role", "status", "created_at"],
+                "properties": {
+                    "username": {"bsonType": "string", "minLength": 3},
+                    "email": {"bsonType": "string", "pattern": EMAIL_PATTERN},
+                    "password_hash": {"bsonType": "string"},
+                    "nome": {"bsonType": "string"},
+                    "role": {"bsonType": "string", "enum": ["admin", "user", "readonly"]},
+                    "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
+                    "last_login": {"bsonType": "date"},
+                    "created_at": {"bsonType": "date"},
+                    "updated_at": {"bsonType": "date"}
+                }
+            }
+        }
+    })
+})
+
 class MongoCloudManager:
     """Gerenciador do MongoDB na cloud"""
     
-    def __init__(self, connection_string: str, database_name: str = "api_consulta_v2"):
+    def __init__(self, connection_string: str, database_name: str = "api_consulta_v2",
+                 **client_options):
         """
         Inicializa o gerenciador do MongoDB
         
         Args:
             connection_string: String de conexão MongoDB Atlas
             database_name: Nome do banco de dados
+            client_options: Sobrescreve opções de MONGO_CLIENT_OPTIONS
         """
         self.connection_string = connection_string
         self.database_name = database_name
+        self.client_options = {**MONGO_CLIENT_OPTIONS, **client_options}
         self.client = None
         self.db = None
+        self._collections_cache: Optional[FrozenSet[str]] = None
+        self._collections_cached_at = 0.0
+    
+    @classmethod
+    def get_shared(cls, uri: Optional[str] = None) -> "MongoCloudManager":
+        """
+        Retorna o gerenciador compartilhado do processo, criando-o na primeira chamada
+        
+        Args:
+            uri: String de conexão (padrão: MONGO_URI do ambiente)
+        """
+        global _SHARED
+        with _SHARED_LOCK:
+            if _SHARED is None:
+                _SHARED = cls(uri or os.getenv('MONGO_URI'))
+            return _SHARED
         
     def connect(self) -> bool:
         """
@@ -43,8 +307,17 @@ class MongoCloudManager:
         Returns:
             bool: True se conectado com sucesso
         """
+        # Reaproveita o cliente existente se ele ainda responde
+        if self.client is not None:
+            try:
+                self.client.admin.command('ping')
+                return True
+            except Exception:
+                self.client.close()
+                self.client = None
+        
         try:
-            self.client = MongoClient(self.connection_string)
+            self.client = MongoClient(self.connection_string, **self.client_options)
             # Testa a conexão
             self.client.admin.command('ping')
             self.db = self.client[self.database_name]
@@ -57,12 +330,25 @@ class MongoCloudManager:
             logger.error(f"❌ Erro inesperado: {e}")
             return False
     
-    def disconnect(self):
-        """Fecha a conexão com o MongoDB"""
+    def disconnect(self, force: bool = False):
+        """Fecha a conexão com o MongoDB (a instância compartilhada só com force=True)"""
+        if self is _SHARED and not force:
+            return
         if self.client:
             self.client.close()
+            self.client = None
+            self.db = None
             logger.info("🔌 Conexão fechada")
     
+    def _collection_names(self, refresh: bool = False) -> FrozenSet[str]:
+        """Nomes das coleções, em cache por COLLECTION_NAMES_TTL segundos"""
+        now = time.monotonic()
+        if (refresh or self._collections_cache is None
+                or now - self._collections_cached_at > COLLECTION_NAMES_TTL):
+            self._collections_cache = frozenset(self.db.list_collection_names())
+            self._collections_cached_at = now
+        return self._collections_cache
+    
     def get_database_info(self) -> Dict:
         """
         Obtém informações sobre o banco de dados
@@ -74,30 +360,49 @@ class MongoCloudManager:
             # Estatísticas do banco
             stats = self.db.command("dbStats")
             
-            # Lista de coleções
-            collections = self.db.list_collection_names()
+            # Lista de coleções (views e outros tipos não têm $collStats/índices)
+            collections = []
+            data_collections = []
+            for entry in self.db.list_collections():
+                collections.append(entry["name"])
+                if entry.get("type", "collection") == "collection":
+                    data_collections.append(entry["name"])
             
             # Informações detalhadas das coleções
             collection_info = {}
             total_documents = 0
             total_indexes = 0
             
-            for collection_name in collections:
+            for collection_name in data_collections:
                 if collection_name.startswith("system."):
                     continue
                     
+                # Contagem e índices vêm dos metadados da coleção em um único
+                # round-trip, sem varrer os documentos (um resultado por shard)
                 collection = self.db[collection_name]
-                count = collection.count_documents({})
-                indexes = list(collection.list_indexes())
+                count = 0
+                index_names = []
+                try:
+                    for shard_stats in collection.aggregate([{"$collStats": {"storageStats": {}}}]):
+                        storage = shard_stats.get("storageStats", {})
+                        count += storage.get("count", 0)
+                        for name in storage.get("indexSizes", {}):
+                            if name not in index_names:
+                                index_names.append(name)
+                except OperationFailure as e:
+                    # Sem permissão para $collStats: contagem pelos metadados
+                    logger.warning(f"⚠️  $collStats indisponível para '{collection_name}': {e}")
+                    count = collection.estimated_document_count()
+                    index_names = [idx.get("name", "unknown") for idx in collection.list_indexes()]
                 
                 collection_info[collection_name] = {
                     "count": count,
-                    "indexes": len(indexes),
-                    "index_names": [idx.get("name", "unknown") for idx in indexes]
+                    "indexes": len(index_names),
+                    "index_names": index_names
                 }
                 
                 total_documents += count
-                total_indexes += len(indexes)
+                total_indexes += len(index_names)
             
             return {
                 "database_name": self.database_name,
@@ -115,224 +420,172 @@ class MongoCloudManager:
     def create_collections_structure(self):
         """Cria a estrutura de coleções recomendada"""
         
-        collections_schema = {
-            "clientes": {
-                "description": "Dados dos clientes",
-                "indexes": [
-                    {"fields": [("cpf", ASCENDING)], "unique": True},
-                    {"fields": [("email", ASCENDING)], "unique": True},
-                    {"fields": [("created_at", DESCENDING)]},
-                    {"fields": [("status", ASCENDING)]},
-                    {"fields": [("cpf", "text"), ("nome", "text"), ("email", "text")]}
-                ],
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["cpf", "nome", "email", "status", "created_at"],
-                        "properties": {
-                            "cpf": {"bsonType": "string", "pattern": "^[0-9]{11}$"},
-                            "nome": {"bsonType": "string", "minLength": 2},
-                            "email": {"bsonType": "string", "pattern": "^[^@]+@[^@]+\\.[^@]+$"},
-                            "telefone": {"bsonType": "string"},
-                            "endereco": {"bsonType": "object"},
-                            "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
-                            "created_at": {"bsonType": "date"},
-                            "updated_at": {"bsonType": "date"}
-                        }
-                    }
-                }
-            },
-            
-            "pagamentos": {
-                "description": "Histórico de pagamentos",
-                "indexes": [
-                    {"fields": [("cliente_id", ASCENDING)]},
-                    {"fields": [("status", ASCENDING)]},
-                    {"fields": [("data_vencimento", ASCENDING)]},
-                    {"fields": [("created_at", DESCENDING)]},
-                    {"fields": [("valor", DESCENDING)]},
-                    {"fields": [("tipo_pagamento", ASCENDING)]}
-                ],
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["cliente_id", "valor", "status", "tipo_pagamento", "created_at"],
-                        "properties": {
-                            "cliente_id": {"bsonType": "objectId"},
-                            "valor": {"bsonType": "decimal"},
-                            "descricao": {"bsonType": "string"},
-                            "status": {"bsonType": "string", "enum": ["pendente", "pago", "cancelado", "vencido"]},
-                            "tipo_pagamento": {"bsonType": "string", "enum": ["boleto", "pix", "cartao"]},
-                            "data_vencimento": {"bsonType": "date"},
-                            "data_pagamento": {"bsonType": "date"},
-                            "created_at": {"bsonType": "date"},
-                            "updated_at": {"bsonType": "date"}
-                        }
-                    }
-                }
-            },
-            
-            "boletos": {
-                "description": "Boletos gerados",
-                "indexes": [
-                    {"fields": [("numero_boleto", ASCENDING)], "unique": True},
-                    {"fields": [("cliente_id", ASCENDING)]},
-                    {"fields": [("pagamento_id", ASCENDING)]},
-                    {"fields": [("status", ASCENDING)]},
-                    {"fields": [("data_vencimento", ASCENDING)]},
-                    {"fields": [("created_at", DESCENDING)]}
-                ],
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["numero_boleto", "cliente_id", "valor", "status", "created_at"],
-                        "properties": {
-                            "numero_boleto": {"bsonType": "string"},
-                            "cliente_id": {"bsonType": "objectId"},
-                            "pagamento_id": {"bsonType": "objectId"},
-                            "valor": {"bsonType": "decimal"},
-                            "data_vencimento": {"bsonType": "date"},
-                            "linha_digitavel": {"bsonType": "string"},
-                            "codigo_barras": {"bsonType": "string"},
-                            "status": {"bsonType": "string", "enum": ["ativo", "pago", "cancelado", "vencido"]},
-                            "created_at": {"bsonType": "date"},
-                            "updated_at": {"bsonType": "date"}
-                        }
-                    }
-                }
-            },
-            
-            "auditoria": {
-                "description": "Log de auditoria do sistema",
-                "indexes": [
-                    {"fields": [("usuario_id", ASCENDING)]},
-                    {"fields": [("acao", ASCENDING)]},
-                    {"fields": [("created_at", DESCENDING)]},
-                    {"fields": [("ip_address", ASCENDING)]},
-                    {"fields": [("recurso", ASCENDING)]}
-                ],
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["acao", "recurso", "created_at"],
-                        "properties": {
-                            "usuario_id": {"bsonType": "objectId"},
-                            "acao": {"bsonType": "string"},
-                            "recurso": {"bsonType": "string"},
-                            "detalhes": {"bsonType": "object"},
-                            "ip_address": {"bsonType": "string"},
-                            "user_agent": {"bsonType": "string"},
-                            "created_at": {"bsonType": "date"}
-                        }
-                    }
-                }
-            },
-            
-            "usuarios": {
-                "description": "Usuários do sistema",
-                "indexes": [
-                    {"fields": [("email", ASCENDING)], "unique": True},
-                    {"fields": [("username", ASCENDING)], "unique": True},
-                    {"fields": [("status", ASCENDING)]},
-                    {"fields": [("role", ASCENDING)]},
-                    {"fields": [("created_at", DESCENDING)]}
-                ],
-                "validator": {
-                    "$jsonSchema": {
-                        "bsonType": "object",
-                        "required": ["username", "email", "password_hash", "role", "status", "created_at"],
-                        "properties": {
-                            "username": {"bsonType": "string", "minLength": 3},
-                            "email": {"bsonType": "string", "pattern": "^[^@]+@[^@]+\\.[^@]+$"},
-                            "password_hash": {"bsonType": "string"},
-                            "nome": {"bsonType": "string"},
-                            "role": {"bsonType": "string", "enum": ["admin", "user", "readonly"]},
-                            "status": {"bsonType": "string", "enum": ["ativo", "inativo", "bloqueado"]},
-                            "last_login": {"bsonType": "date"},
-                            "created_at": {"bsonType": "date"},
-                            "updated_at": {"bsonType": "date"}
-                        }
-                    }
-                }
-            }
-        }
-        
-        for collection_name, schema in collections_schema.items():
+        # Cópia local: o cache é imutável e pode estar em uso por outras threads
+        names = set(self._collection_names(refresh=True))
+        for collection_name, schema in _COLLECTIONS_SCHEMA.items():
             try:
                 # Cria a coleção se não existir
-                if collection_name not in self.db.list_collection_names():
+                if collection_name not in names:
                     self.db.create_collection(
                         collection_name,
                         validator=schema.get("validator")
                     )
+                    names.add(collection_name)
+                    self._collections_cache = None
                     logger.info(f"✅ Coleção '{collection_name}' criada")
                 
-                # Cria os índices
+                # Remove índices legados substituídos por uma nova definição
+                # (ex.: usuario_id_1 comum -> usuario_id_parcial), que conflitariam
+                legacy = {spec["replaces"] for spec in schema["indexes"] if "replaces" in spec}
+                if legacy:
+                    for index in self.db[collection_name].list_indexes():
+                        if index["name"] in legacy:
+                            self.db[collection_name].drop_index(index["name"])
+                            logger.info(f"🗑️  Índice legado '{index['name']}' removido de '{collection_name}'")
+                
+                # Cria os índices em um único comando createIndexes
+                models = [
+                    IndexModel(index_spec["fields"], **{
+                        option: index_spec[option]
+                        for option in _INDEX_OPTIONS if option in index_spec
+                    })
+                    for index_spec in schema["indexes"]
+                ]
+                # (índices idênticos já existentes não geram erro no servidor)
                 collection = self.db[collection_name]
-                for index_spec in schema["indexes"]:
-                    try:
-                        if "unique" in index_spec:
-                            collection.create_index(
-                                index_spec["fields"],
-                                unique=index_spec["unique"]
+                try:
+                    index_names = collection.create_indexes(models)
+                except OperationFailure as e:
+                    # Algum índice conflita (nome/opções): repete um a um para
+                    # que só o índice com problema fique de fora
+                    logger.warning(f"⚠️  Erro ao criar índices em '{collection_name}', tentando um a um: {e}")
+                    index_names = []
+                    for model in models:
+                        try:
+                            index_names += collection.create_indexes([model])
+                        except OperationFailure as index_error:
+                            logger.warning(
+                                f"⚠️  Erro ao criar índice {model.document['key']} "
+                                f"em '{collection_name}': {index_error}"
                             )
-                        else:
-                            collection.create_index(index_spec["fields"])
-                        logger.info(f"📊 Índice criado em '{collection_name}': {index_spec['fields']}")
-                    except OperationFailure as e:
-                        if "already exists" not in str(e):
-                            logger.warning(f"⚠️  Erro ao criar índice: {e}")
+                logger.debug(f"📊 Índices em '{collection_name}': {index_names}")
+                logger.info(f"📊 Índices criados em '{collection_name}': {len(index_names)}")
                 
             except Exception as e:
                 logger.error(f"❌ Erro ao criar coleção '{collection_name}': {e}")
     
+    def _collection_workers(self, total: int) -> int:
+        """Threads para trabalho por coleção, sem exceder o pool de conexões"""
+        return max(1, min(MAX_COLLECTION_WORKERS, total, self.client_options["maxPoolSize"]))
+    
+    def _compact_one(self, collection_name: str):
+        """Compacta uma coleção e limpa o cache de planos de consulta"""
+        try:
+            self.db.command("compact", collection_name)
+            self.db.command("planCacheClear", collection_name)
+        except OperationFailure as e:
+            logger.warning(f"⚠️  Falha ao compactar '{collection_name}': {e}")
+            return
+        logger.info(f"🔄 Coleção '{collection_name}' compactada")
+    
     def optimize_database(self):
         """Otimiza o banco de dados"""
         try:
-            # Reindexação
-            for collection_name in self.db.list_collection_names():
-                self.db[collection_name].reindex()
-                logger.info(f"🔄 Coleção '{collection_name}' reindexada")
+            # reIndex não roda em replica sets/mongos (Atlas): a manutenção dos
+            # índices é do servidor, então não há o que fazer por coleção
+            hello = self.client.admin.command("hello")
+            if hello.get("msg") == "isdbgrid" or "setName" in hello:
+                logger.info("ℹ️  Deployment gerenciado (replica set/sharded): otimização feita pelo servidor")
+                return
+            
+            # Compactação (apenas para self-hosted standalone): coleções
+            # independentes, processadas em paralelo; views e system.* não
+            # aceitam compact
+            names = [
+                name for name in self.db.list_collection_names(filter={"type": "collection"})
+                if not name.startswith("system.")
+            ]
+            if names:
+                with ThreadPoolExecutor(max_workers=self._collection_workers(len(names))) as pool:
+                    list(pool.map(self._compact_one, names))
             
-            # Compactação (apenas para self-hosted MongoDB)
-            # Para MongoDB Atlas, isso é gerenciado automaticamente
             logger.info("✅ Otimização concluída")
             
         except Exception as e:
             logger.error(f"❌ Erro na otimização: {e}")
     
-    def backup_data(self, output_file: str = None):
+    def _backup_one_collection(self, collection_name: str, out, pretty: bool) -> int:
+        """Grava os documentos de uma coleção como itens de um array JSON"""
+        # Cursor exhaust: o servidor envia os lotes em sequência, sem esperar
+        # um getMore por lote (mongos não suporta, lá fica o cursor comum)
+        cursor_type = CursorType.NON_TAILABLE if self.client.is_mongos else CursorType.EXHAUST
+        cursor = self.db[collection_name].find(
+            {}, batch_size=BACKUP_BATCH_SIZE, cursor_type=cursor_type, no_cursor_timeout=True
+        )
+        count = 0
+        try:
+            for doc in cursor:
+                if count:
+                    out.write(b",")
+                out.write(b"\n")
+                out.write(_dumps_doc(doc, pretty))
+                count += 1
+        finally:
+            cursor.close()
+        logger.info(f"📦 Backup da coleção '{collection_name}': {count} documentos")
+        return count
+    
+    def _backup_to_tempfile(self, collection_name: str, directory: str, pretty: bool):
+        """Faz o backup de uma coleção em um arquivo temporário"""
+        out = tempfile.TemporaryFile("w+b", dir=directory)
+        try:
+            self._backup_one_collection(collection_name, out, pretty)
+            out.seek(0)
+            return out
+        except Exception:
+            out.close()
+            raise
+    
+    def backup_data(self, output_file: str = None, pretty: bool = False):
         """
         Faz backup dos dados em formato JSON
         
         Args:
             output_file: Arquivo de saída (opcional)
+            pretty: Indenta cada documento (arquivo maior)
         """
         if not output_file:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
             output_file = f"backup_mongodb_{timestamp}.json"
         
         try:
-            backup_data = {}
-            
-            for collection_name in self.db.list_collection_names():
-                collection = self.db[collection_name]
-                documents = list(collection.find())
-                
-                # Converte ObjectId para string
-                for doc in documents:
-                    if '_id' in doc:
-                        doc['_id'] = str(doc['_id'])
-                    # Converte datas para string
-                    for key, value in doc.items():
-                        if isinstance(value, datetime):
-                            doc[key] = value.isoformat()
-                
-                backup_data[collection_name] = documents
-                logger.info(f"📦 Backup da coleção '{collection_name}': {len(documents)} documentos")
+            # Cada coleção é lida em paralelo e gravada, documento a documento,
+            # em seu próprio arquivo temporário; depois os trechos são
+            # concatenados em ordem no arquivo final. A memória fica limitada
+            # a um lote de cursor por thread.
+            # Documentos em Extended JSON via orjson (encoder em C), com
+            # json_util como fallback e para os tipos BSON
+            names = sorted(self._collection_names())
+            directory = os.path.dirname(os.path.abspath(output_file))
+            with ThreadPoolExecutor(max_workers=self._collection_workers(len(names))) as pool:
+                futures = [
+                    pool.submit(self._backup_to_tempfile, name, directory, pretty) for name in names
+                ]
+                parts = [future.result() for future in futures]
             
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(backup_data, f, indent=2, ensure_ascii=False)
+            try:
+                with open(output_file, 'wb') as f:
+                    f.write(b"{")
+                    for i, (collection_name, part) in enumerate(zip(names, parts)):
+                        if i:
+                            f.write(b",")
+                        f.write(f"\n{json.dumps(collection_name, ensure_ascii=False)}: [".encode("utf-8"))
+                        shutil.copyfileobj(part, f)
+                        f.write(b"\n]")
+                    f.write(b"\n}\n")
+            finally:
+                for part in parts:
+                    part.close()
             
             logger.info(f"✅ Backup salvo em: {output_file}")
             return output_file
@@ -341,26 +594,50 @@ class MongoCloudManager:
             logger.error(f"❌ Erro no backup: {e}")
             return None
     
+    def _has_unique_cpf_index(self) -> bool:
+        """Verifica se clientes já tem índice único em cpf"""
+        return any(
+            list(index["key"].items()) == [("cpf", 1)] and index.get("unique")
+            for index in self.db.clientes.list_indexes()
+        )
+    
     def cleanup_data(self):
         """Limpeza e organização dos dados"""
         try:
-            # Remove documentos duplicados baseado em CPF (clientes)
-            if "clientes" in self.db.list_collection_names():
+            # Remove documentos duplicados baseado em CPF (clientes); com o
+            # índice único em cpf não há duplicados possíveis e a varredura é pulada
+            if "clientes" in self._collection_names() and not self._has_unique_cpf_index():
+                # Mantém o menor _id de cada CPF e emite uma linha por duplicado,
+                # sem acumular arrays de _ids por grupo (limite de 16MB do BSON)
                 pipeline = [
+                    {"$project": {"cpf": 1}},
                     {"$group": {
                         "_id": "$cpf",
                         "count": {"$sum": 1},
-                        "docs": {"$push": "$_id"}
+                        "first": {"$min": "$_id"}
                     }},
-                    {"$match": {"count": {"$gt": 1}}}
+                    {"$match": {"count": {"$gt": 1}}},
+                    {"$lookup": {
+                        "from": "clientes",
+                        "let": {"cpf": "$_id", "keep": "$first"},
+                        "pipeline": [
+                            {"$match": {"$expr": {"$and": [
+                                {"$eq": ["$cpf", "$$cpf"]},
+                                {"$ne": ["$_id", "$$keep"]}
+                            ]}}},
+                            {"$project": {"_id": 1}}
+                        ],
+                        "as": "dups"
+                    }},
+                    {"$unwind": "$dups"},
+                    {"$project": {"_id": "$dups._id"}}
                 ]
                 
-                duplicates = list(self.db.clientes.aggregate(pipeline))
-                for dup in duplicates:
-                    # Mantém apenas o primeiro documento
-                    docs_to_remove = dup["docs"][1:]
-                    self.db.clientes.delete_many({"_id": {"$in": docs_to_remove}})
-                    logger.info(f"🧹 Removidos {len(docs_to_remove)} duplicados para CPF: {dup['_id']}")
+                removed = self._delete_ids(self.db.clientes, self.db.clientes.aggregate(
+                    pipeline, allowDiskUse=True, batchSize=DELETE_BATCH_SIZE
+                ))
+                if removed > 0:
+                    logger.info(f"🧹 Removidos {removed} clientes duplicados por CPF")
             
             # Remove documentos órfãos
             self._remove_orphaned_documents()
@@ -370,26 +647,165 @@ class MongoCloudManager:
         except Exception as e:
             logger.error(f"❌ Erro na limpeza: {e}")
     
+    def _delete_ids(self, collection, cursor) -> int:
+        """Remove, em lotes de DELETE_BATCH_SIZE, os _ids emitidos pelo cursor"""
+        deleted = 0
+        batch = []
+        for doc in cursor:
+            batch.append(doc["_id"])
+            if len(batch) >= DELETE_BATCH_SIZE:
+                deleted += collection.delete_many({"_id": {"$in": batch}}).deleted_count
+                batch = []
+        if batch:
+            deleted += collection.delete_many({"_id": {"$in": batch}}).deleted_count
+        return deleted
+    
+    def _delete_orphans(self, collection_name: str, local_field: str, parent_name: str) -> int:
+        """Remove documentos cujo local_field não referencia um _id da coleção pai"""
+        # A junção roda no servidor; só os _ids órfãos trafegam, em lotes
+        pipeline = [
+            {"$lookup": {
+                "from": parent_name,
+                "localField": local_field,
+                "foreignField": "_id",
+                "as": "_parent"
+            }},
+            {"$match": {"_parent": {"$eq": []}}},
+            {"$project": {"_id": 1}}
+        ]
+        collection = self.db[collection_name]
+        return self._delete_ids(collection, collection.aggregate(
+            pipeline, allowDiskUse=True, batchSize=DELETE_BATCH_SIZE
+        ))
+    
     def _remove_orphaned_documents(self):
         """Remove documentos órfãos"""
         try:
+            names = self._collection_names()
+            
             # Remove pagamentos sem cliente
-            if all(coll in self.db.list_collection_names() for coll in ["clientes", "pagamentos"]):
-                client_ids = set(doc["_id"] for doc in self.db.clientes.find({}, {"_id": 1}))
-                orphaned_payments = self.db.pagamentos.find({"cliente_id": {"$nin": list(client_ids)}})
-                orphaned_count = self.db.pagamentos.delete_many({"cliente_id": {"$nin": list(client_ids)}}).deleted_count
+            if {"clientes", "pagamentos"} <= names:
+                orphaned_count = self._delete_orphans("pagamentos", "cliente_id", "clientes")
                 if orphaned_count > 0:
                     logger.info(f"🧹 Removidos {orphaned_count} pagamentos órfãos")
             
             # Remove boletos sem pagamento
-            if all(coll in self.db.list_collection_names() for coll in ["pagamentos", "boletos"]):
-                payment_ids = set(doc["_id"] for doc in self.db.pagamentos.find({}, {"_id": 1}))
-                orphaned_boletos = self.db.boletos.delete_many({"pagamento_id": {"$nin": list(payment_ids)}}).deleted_count
+            if {"pagamentos", "boletos"} <= names:
+                orphaned_boletos = self._delete_orphans("boletos", "pagamento_id", "pagamentos")
                 if orphaned_boletos > 0:
                     logger.info(f"🧹 Removidos {orphaned_boletos} boletos órfãos")
                     
         except Exception as e:
             logger.error(f"❌ Erro ao remover órfãos: {e}")
+    
+    def bulk_upsert_clients(self, docs: Iterable[Mapping], batch: int = 1000) -> Dict[str, int]:
+        """
+        Insere ou atualiza clientes por CPF em lotes
+        
+        Cada lote vai em um único bulk_write com ordered=False, permitindo ao
+        servidor aplicar as escritas sem serializá-las.
+        
+        Args:
+            docs: Documentos de clientes (cada lote é validado com validate_client_doc
+                antes do bulk_write; ValueError se algum for inválido)
+            batch: Quantidade de operações por bulk_write
+            
+        Returns:
+            Dict: Totais de documentos inseridos, encontrados e modificados
+        """
+        totals = {"upserted": 0, "matched": 0, "modified": 0}
+        docs = iter(docs)
+        while True:
+            chunk = list(islice(docs, batch))
+            if not chunk:
+                return totals
+            
+            # Valida o lote inteiro antes de escrever: um documento inválido
+            # não deixa parte do lote gravada
+            for doc in chunk:
+                validate_client_doc(doc)
+            
+            now = datetime.now(timezone.utc)
+            ops = []
+            for doc in chunk:
+                fields = {k: v for k, v in doc.items() if k not in ("_id", "created_at")}
+                fields["updated_at"] = now
+                ops.append(UpdateOne(
+                    {"cpf": doc["cpf"]},
+                    {"$set": fields, "$setOnInsert": {"created_at": doc.get("created_at", now)}},
+                    upsert=True
+                ))
+            
+            result = self.db.clientes.bulk_write(ops, ordered=False)
+            totals["upserted"] += result.upserted_count
+            totals["matched"] += result.matched_count
+            totals["modified"] += result.modified_count
+            logger.debug(f"👤 Lote de {len(ops)} clientes gravado")
+
+def _show_info(manager: MongoCloudManager):
+    """Mostra as informações do banco"""
+    print("\n📊 Informações do Banco de Dados:")
+    info = manager.get_database_info()
+    print(json.dumps(info, indent=2, default=str))
+
+
+def _create_structure(manager: MongoCloudManager):
+    """Cria/atualiza a estrutura de coleções"""
+    print("\n🏗️  Criando estrutura de coleções...")
+    manager.create_collections_structure()
+    print("✅ Estrutura atualizada!")
+
+
+def _optimize(manager: MongoCloudManager):
+    """Otimiza o banco de dados"""
+    print("\n⚡ Otimizando banco de dados...")
+    manager.optimize_database()
+
+
+def _backup(manager: MongoCloudManager):
+    """Faz backup dos dados"""
+    print("\n💾 Fazendo backup...")
+    backup_file = manager.backup_data()
+    if backup_file:
+        print(f"✅ Backup concluído: {backup_file}")
+
+
+def _cleanup(manager: MongoCloudManager):
+    """Limpa e organiza os dados"""
+    print("\n🧹 Limpando e organizando dados...")
+    manager.cleanup_data()
+
+
+def _maintenance(manager: MongoCloudManager):
+    """Executa limpeza, estrutura e otimização, nesta ordem"""
+    # Em sequência: o índice único de cpf só pode ser criado depois que os
+    # duplicados saem, e a compactação não deve concorrer com a criação de índices
+    _cleanup(manager)
+    _create_structure(manager)
+    _optimize(manager)
+
+
+# Opções do menu: escolha -> (rótulo, ação)
+_ACTIONS: Dict[str, Tuple[str, Callable[[MongoCloudManager], Any]]] = {
+    "1": ("Ver informações do banco", _show_info),
+    "2": ("Criar/Atualizar estrutura de coleções", _create_structure),
+    "3": ("Otimizar banco de dados", _optimize),
+    "4": ("Fazer backup dos dados", _backup),
+    "5": ("Limpar e organizar dados", _cleanup),
+    "7": ("Limpar, atualizar estrutura e otimizar (5, 2 e 3)", _maintenance),
+}
+_EXIT_CHOICE = "6"
+_LAST_CHOICE = "7"
+_MENU = "\n".join(
+    ["\n📋 Opções disponíveis:"]
+    + [
+        f"{choice}. {label}"
+        for choice, label in sorted(
+            [(choice, label) for choice, (label, _) in _ACTIONS.items()]
+            + [(_EXIT_CHOICE, "Sair")]
+        )
+    ]
+)
 
 def main():
     """Função principal"""
@@ -413,7 +829,7 @@ def main():
         connection_string = connection_string.replace('<db_password>', password)
     
     # Inicializa o gerenciador
-    manager = MongoCloudManager(connection_string)
+    manager = MongoCloudManager.get_shared(connection_string)
     
     if not manager.connect():
         print("❌ Não foi possível conectar ao banco")
@@ -421,48 +837,20 @@ def main():
     
     try:
         while True:
-            print("\n📋 Opções disponíveis:")
-            print("1. Ver informações do banco")
-            print("2. Criar/Atualizar estrutura de coleções")
-            print("3. Otimizar banco de dados")
-            print("4. Fazer backup dos dados")
-            print("5. Limpar e organizar dados")
-            print("6. Sair")
-            
-            choice = input("\nEscolha uma opção (1-6): ").strip()
+            print(_MENU)
             
-            if choice == "1":
-                print("\n📊 Informações do Banco de Dados:")
-                info = manager.get_database_info()
-                print(json.dumps(info, indent=2, default=str))
-                
-            elif choice == "2":
-                print("\n🏗️  Criando estrutura de coleções...")
-                manager.create_collections_structure()
-                print("✅ Estrutura atualizada!")
-                
-            elif choice == "3":
-                print("\n⚡ Otimizando banco de dados...")
-                manager.optimize_database()
-                
-            elif choice == "4":
-                print("\n💾 Fazendo backup...")
-                backup_file = manager.backup_data()
-                if backup_file:
-                    print(f"✅ Backup concluído: {backup_file}")
-                    
-            elif choice == "5":
-                print("\n🧹 Limpando e organizando dados...")
-                manager.cleanup_data()
-                
-            elif choice == "6":
+            choice = input(f"\nEscolha uma opção (1-{_LAST_CHOICE}): ").strip()
+            if choice == _EXIT_CHOICE:
                 break
-                
-            else:
+            
+            action = _ACTIONS.get(choice)
+            if not action:
                 print("❌ Opção inválida")
+                continue
+            action[1](manager)
     
     finally:
-        manager.disconnect()
+        manager.disconnect(force=True)
 
 if __name__ == "__main__":
     main()
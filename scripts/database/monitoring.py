@@ -4,17 +4,24 @@ MongoDB Monitoring and Metrics
 Monitora performance e métricas do banco MongoDB na cloud
 """
 
+import asyncio
 import os
 import sys
 import time
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from datetime import datetime, timezone, timedelta
 import logging
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, OperationFailure
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, is_dataclass
 from collections import defaultdict
+import heapq
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Configuração de logging
 logging.basicConfig(
@@ -23,6 +30,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Validade, em segundos, do cache de nomes de coleções: um relatório
+# (métricas + uso de índices) lista as coleções uma única vez
+CATALOG_CACHE_TTL = 5.0
+
+# serverStatus só com as seções lidas pelo monitor (a resposta completa,
+# com wiredTiger, tcmalloc etc., pode passar de 1MB)
+SERVER_STATUS_FIELDS = {
+    "serverStatus": 1,
+    "repl": 0,
+    "metrics": 0,
+    "locks": 0,
+    "wiredTiger": 0,
+    "tcmalloc": 0,
+    "network": 0,
+    "security": 0,
+    "transactions": 0,
+    "opLatencies": 0,
+    "storageEngine": 0,
+    "transportSecurity": 0,
+    "trafficRecording": 0,
+    "electionMetrics": 0,
+    "mirroredReads": 0,
+    "opWorkingTime": 0,
+    "opcounters": 1,
+    "connections": 1,
+}
+
+# Documentos do profiler por lote do cursor
+PROFILER_BATCH_SIZE = 50
+
+# Quantidade de consultas lentas listadas no relatório
+SLOWEST_QUERIES_LIMIT = 10
+
 @dataclass
 class DatabaseMetrics:
     """Métricas do banco de dados"""
@@ -57,6 +97,8 @@ class MongoMonitor:
         self.client = None
         self.db = None
         self.admin_db = None
+        # (instante da leitura, nomes das coleções de usuário)
+        self._catalog_cache: Optional[Tuple[float, List[str]]] = None
         
     def connect(self) -> bool:
         """Conecta ao MongoDB"""
@@ -65,6 +107,7 @@ class MongoMonitor:
             self.client.admin.command('ping')
             self.db = self.client[self.database_name]
             self.admin_db = self.client.admin
+            self._catalog_cache = None
             logger.info(f"✅ Conectado ao MongoDB - Database: {self.database_name}")
             return True
         except ConnectionFailure as e:
@@ -77,9 +120,9 @@ class MongoMonitor:
             self.client.close()
     
     def get_server_status(self) -> Dict[str, Any]:
-        """Obtém status do servidor MongoDB"""
+        """Obtém status do servidor MongoDB (só opcounters e connections)"""
         try:
-            return self.admin_db.command("serverStatus")
+            return self.admin_db.command(SERVER_STATUS_FIELDS)
         except Exception as e:
             logger.error(f"❌ Erro ao obter server status: {e}")
             return {}
@@ -92,15 +135,54 @@ class MongoMonitor:
             logger.error(f"❌ Erro ao obter database stats: {e}")
             return {}
     
-    def get_collection_stats(self, collection_name: str) -> Dict[str, Any]:
-        """Obtém estatísticas de uma coleção"""
+    def _user_collections(self) -> List[str]:
+        """Nomes das coleções de dados, sem views e de sistema (em cache por CATALOG_CACHE_TTL)"""
+        now = time.monotonic()
+        if self._catalog_cache is None or now - self._catalog_cache[0] >= CATALOG_CACHE_TTL:
+            # Views não aceitam $collStats/$indexStats
+            names = [
+                name for name in self.db.list_collection_names(filter={"type": "collection"})
+                if not name.startswith("system.")
+            ]
+            self._catalog_cache = (now, names)
+        return self._catalog_cache[1]
+    
+    def _aggregate_all_collections(self, names: List[str],
+                                   stages: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """
+        Executa os mesmos estágios em todas as coleções em um único round-trip
+        
+        O pipeline roda na primeira coleção e agrega as demais com $unionWith;
+        cada resultado recebe o campo "collection" com a origem. Se o pipeline
+        combinado falhar, repete coleção a coleção.
+        
+        Returns:
+            Tuple: (resultados, coleções em que os estágios falharam)
+        """
+        def tagged(name: str) -> List[Dict]:
+            return stages + [{"$addFields": {"collection": name}}]
+        
+        first, *others = names
+        pipeline = tagged(first) + [
+            {"$unionWith": {"coll": name, "pipeline": tagged(name)}} for name in others
+        ]
         try:
-            return self.db.command("collStats", collection_name)
-        except Exception as e:
-            logger.error(f"❌ Erro ao obter stats da coleção {collection_name}: {e}")
-            return {}
+            return list(self.db[first].aggregate(pipeline)), []
+        except OperationFailure as e:
+            # Uma coleção sem permissão derruba o pipeline inteiro
+            logger.warning(f"⚠️  Agregação combinada falhou, consultando coleção a coleção: {e}")
+        
+        results = []
+        failed = []
+        for name in names:
+            try:
+                results.extend(self.db[name].aggregate(tagged(name)))
+            except OperationFailure as e:
+                logger.warning(f"⚠️  Não foi possível consultar {name}: {e}")
+                failed.append(name)
+        return results, failed
     
-    def get_profiler_data(self, minutes: int = 5) -> List[Dict]:
+    def get_profiler_data(self, minutes: int = 5) -> Iterable[Dict]:
         """Obtém dados do profiler (consultas lentas)"""
         try:
             # Ativa o profiler se não estiver ativo
@@ -109,11 +191,15 @@ class MongoMonitor:
             # Busca operações dos últimos minutos
             since = datetime.now(timezone.utc) - timedelta(minutes=minutes)
             
-            profiler_data = list(self.db["system.profile"].find({
-                "ts": {"$gte": since}
-            }).sort("ts", -1).limit(100))
-            
-            return profiler_data
+            # Seleção no servidor: só os campos usados na análise trafegam
+            # (sem execStats, locks, planSummary etc.); o cursor é consumido
+            # em lotes pelo chamador, sem materializar a lista
+            return self.db["system.profile"].aggregate([
+                {"$match": {"ts": {"$gte": since}}},
+                {"$sort": {"ts": -1}},
+                {"$limit": 100},
+                {"$project": {"_id": 0, "ts": 1, "millis": 1, "op": 1, "ns": 1, "command": 1}}
+            ], batchSize=PROFILER_BATCH_SIZE)
         except Exception as e:
             logger.error(f"❌ Erro ao obter dados do profiler: {e}")
             return []
@@ -123,41 +209,55 @@ class MongoMonitor:
         try:
             profiler_data = self.get_profiler_data(minutes)
             
-            if not profiler_data:
-                return {"message": "Nenhuma operação registrada no profiler"}
-            
-            slow_queries = []
+            # Passada única pelo cursor; das consultas lentas só as
+            # SLOWEST_QUERIES_LIMIT maiores ficam em memória (min-heap)
+            slowest = []
+            slow_count = 0
             operations_by_type = defaultdict(int)
             operations_by_collection = defaultdict(int)
+            total_operations = 0
             total_time = 0
             
             for op in profiler_data:
-                duration_ms = op.get("millis", op.get("ts", {}).get("millis", 0))
+                total_operations += 1
+                duration_ms = op.get("millis", 0)
+                op_type = op.get("op") or "unknown"
+                ns = op.get("ns") or ""
+                _, dot, collection = ns.rpartition(".")
                 
                 if duration_ms > 100:  # Consultas > 100ms
-                    slow_queries.append({
-                        "timestamp": op.get("ts"),
-                        "duration_ms": duration_ms,
-                        "operation": op.get("op", "unknown"),
-                        "collection": op.get("ns", "").split(".")[-1] if "." in op.get("ns", "") else op.get("ns", ""),
-                        "command": str(op.get("command", {}))[:200] + "..." if len(str(op.get("command", {}))) > 200 else str(op.get("command", {}))
-                    })
+                    slow_count += 1
+                    if len(slowest) < SLOWEST_QUERIES_LIMIT or duration_ms > slowest[0][0]:
+                        command = str(op.get("command", {}))
+                        entry = (duration_ms, slow_count, {
+                            "timestamp": op.get("ts"),
+                            "duration_ms": duration_ms,
+                            "operation": op_type,
+                            "collection": collection,
+                            "command": command[:200] + "..." if len(command) > 200 else command
+                        })
+                        if len(slowest) < SLOWEST_QUERIES_LIMIT:
+                            heapq.heappush(slowest, entry)
+                        else:
+                            heapq.heapreplace(slowest, entry)
                 
-                operations_by_type[op.get("op", "unknown")] += 1
-                if "." in op.get("ns", ""):
-                    collection = op.get("ns").split(".")[-1]
+                operations_by_type[op_type] += 1
+                if dot:
                     operations_by_collection[collection] += 1
                 
                 total_time += duration_ms
             
+            if not total_operations:
+                return {"message": "Nenhuma operação registrada no profiler"}
+            
             return {
                 "period_minutes": minutes,
-                "total_operations": len(profiler_data),
-                "slow_queries_count": len(slow_queries),
-                "avg_duration_ms": round(total_time / len(profiler_data), 2) if profiler_data else 0,
+                "total_operations": total_operations,
+                "slow_queries_count": slow_count,
+                "avg_duration_ms": round(total_time / total_operations, 2),
                 "operations_by_type": dict(operations_by_type),
                 "operations_by_collection": dict(operations_by_collection),
-                "slowest_queries": sorted(slow_queries, key=lambda x: x["duration_ms"], reverse=True)[:10]
+                "slowest_queries": [entry for *_, entry in sorted(slowest, reverse=True)]
             }
         except Exception as e:
             logger.error(f"❌ Erro ao analisar consultas lentas: {e}")
@@ -167,33 +267,30 @@ class MongoMonitor:
         """Analisa uso de índices"""
         try:
             index_usage = {}
+            names = self._user_collections()
+            if not names:
+                return index_usage
             
-            for collection_name in self.db.list_collection_names():
-                collection = self.db[collection_name]
-                
-                # Obtém estatísticas de uso dos índices
+            # Uma única agregação ($indexStats + $unionWith) para todas as coleções
+            for name in names:
+                index_usage[name] = []
+            index_stats, failed = self._aggregate_all_collections(names, [{"$indexStats": {}}])
+            for index_stat in index_stats:
+                index_usage[index_stat["collection"]].append({
+                    "name": index_stat.get("name"),
+                    "usage_count": index_stat.get("accesses", {}).get("ops", 0),
+                    "since": index_stat.get("accesses", {}).get("since")
+                })
+            
+            # MongoDB Atlas pode não permitir $indexStats: lista apenas os índices
+            for name in failed:
                 try:
-                    stats = collection.aggregate([{"$indexStats": {}}])
-                    collection_indexes = []
-                    
-                    for index_stat in stats:
-                        collection_indexes.append({
-                            "name": index_stat.get("name"),
-                            "usage_count": index_stat.get("accesses", {}).get("ops", 0),
-                            "since": index_stat.get("accesses", {}).get("since")
-                        })
-                    
-                    index_usage[collection_name] = collection_indexes
-                except Exception as e:
-                    # MongoDB Atlas pode não permitir $indexStats
-                    logger.warning(f"⚠️  Não foi possível obter estatísticas de índice para {collection_name}: {e}")
-                    
-                    # Fallback: lista apenas os índices
-                    indexes = list(collection.list_indexes())
-                    index_usage[collection_name] = [
-                        {"name": idx.get("name"), "keys": idx.get("key")} 
-                        for idx in indexes
+                    index_usage[name] = [
+                        {"name": idx.get("name"), "keys": idx.get("key")}
+                        for idx in self.db[name].list_indexes()
                     ]
+                except Exception as e:
+                    logger.warning(f"⚠️  Não foi possível listar os índices de {name}: {e}")
             
             return index_usage
         except Exception as e:
@@ -212,21 +309,42 @@ class MongoMonitor:
             # Estatísticas das coleções
             collection_stats = {}
             total_documents = 0
+            total_index_count = 0
             
-            for collection_name in self.db.list_collection_names():
-                if collection_name.startswith("system."):
-                    continue
-                    
-                coll_stats = self.get_collection_stats(collection_name)
-                if coll_stats:
-                    collection_stats[collection_name] = {
-                        "count": coll_stats.get("count", 0),
-                        "size_mb": round(coll_stats.get("size", 0) / (1024 * 1024), 2),
-                        "avg_obj_size": coll_stats.get("avgObjSize", 0),
-                        "index_count": coll_stats.get("nindexes", 0),
-                        "index_size_mb": round(coll_stats.get("totalIndexSize", 0) / (1024 * 1024), 2)
-                    }
-                    total_documents += coll_stats.get("count", 0)
+            # Um único $collStats + $unionWith em vez de um collStats por coleção
+            names = self._user_collections()
+            all_stats, _ = self._aggregate_all_collections(names, [
+                {"$collStats": {"storageStats": {}}},
+                {"$project": {
+                    "count": "$storageStats.count",
+                    "size": "$storageStats.size",
+                    "nindexes": "$storageStats.nindexes",
+                    "totalIndexSize": "$storageStats.totalIndexSize"
+                }}
+            ]) if names else ([], [])
+            
+            # Em clusters shardados vem uma linha por shard: soma por coleção
+            # (os índices são os mesmos em todos os shards)
+            totals = {}
+            for coll_stats in all_stats:
+                acc = totals.setdefault(coll_stats["collection"], {
+                    "count": 0, "size": 0, "nindexes": 0, "totalIndexSize": 0
+                })
+                acc["count"] += coll_stats.get("count", 0)
+                acc["size"] += coll_stats.get("size", 0)
+                acc["totalIndexSize"] += coll_stats.get("totalIndexSize", 0)
+                acc["nindexes"] = max(acc["nindexes"], coll_stats.get("nindexes", 0))
+            
+            for collection_name, acc in totals.items():
+                collection_stats[collection_name] = {
+                    "count": acc["count"],
+                    "size_mb": round(acc["size"] / (1024 * 1024), 2),
+                    "avg_obj_size": acc["size"] // acc["count"] if acc["count"] else 0,
+                    "index_count": acc["nindexes"],
+                    "index_size_mb": round(acc["totalIndexSize"] / (1024 * 1024), 2)
+                }
+                total_documents += acc["count"]
+                total_index_count += acc["nindexes"]
             
             # Operações por segundo
             operations = server_status.get("opcounters", {})
@@ -247,7 +365,7 @@ class MongoMonitor:
                 total_size_mb=round(db_stats.get("dataSize", 0) / (1024 * 1024), 2),
                 total_documents=total_documents,
                 total_collections=len(collection_stats),
-                index_count=sum(stats["index_count"] for stats in collection_stats.values()),
+                index_count=total_index_count,
                 avg_query_time_ms=0,  # Seria necessário calcular a partir do profiler
                 connections_current=connections.get("current", 0),
                 operations_per_second=ops_per_second,
@@ -270,16 +388,17 @@ class MongoMonitor:
             
             # Análises e recomendações
             recommendations = []
+            under_indexed, large_documents = self._flag_collections(metrics)
             
             # Verifica coleções sem índices adequados
-            for coll_name, stats in metrics.collection_stats.items():
-                if stats["count"] > 1000 and stats["index_count"] <= 1:
-                    recommendations.append(f"⚠️  Coleção '{coll_name}' tem {stats['count']} documentos mas apenas {stats['index_count']} índice(s)")
+            for coll_name in under_indexed:
+                stats = metrics.collection_stats[coll_name]
+                recommendations.append(f"⚠️  Coleção '{coll_name}' tem {stats['count']} documentos mas apenas {stats['index_count']} índice(s)")
             
             # Verifica tamanho médio dos documentos
-            for coll_name, stats in metrics.collection_stats.items():
-                if stats["avg_obj_size"] > 1024 * 1024:  # > 1MB
-                    recommendations.append(f"📏 Coleção '{coll_name}' tem documentos grandes (média: {round(stats['avg_obj_size'] / 1024, 2)}KB)")
+            for coll_name in large_documents:
+                stats = metrics.collection_stats[coll_name]
+                recommendations.append(f"📏 Coleção '{coll_name}' tem documentos grandes (média: {round(stats['avg_obj_size'] / 1024, 2)}KB)")
             
             # Verifica consultas lentas
             if slow_queries.get("slow_queries_count", 0) > 10:
@@ -299,16 +418,33 @@ class MongoMonitor:
                 "slow_queries_analysis": slow_queries,
                 "index_usage": index_usage,
                 "recommendations": recommendations,
-                "health_score": self._calculate_health_score(metrics, slow_queries)
+                "health_score": self._calculate_health_score(
+                    metrics, slow_queries, (under_indexed, large_documents)
+                )
             }
             
         except Exception as e:
             logger.error(f"❌ Erro ao gerar relatório: {e}")
             return {"error": str(e)}
     
-    def _calculate_health_score(self, metrics: DatabaseMetrics, slow_queries: Dict) -> int:
+    @staticmethod
+    def _flag_collections(metrics: DatabaseMetrics) -> Tuple[List[str], List[str]]:
+        """Coleções com poucos índices e com documentos grandes, em uma única passada"""
+        under_indexed = []
+        large_documents = []
+        for coll_name, stats in metrics.collection_stats.items():
+            if stats["count"] > 1000 and stats["index_count"] <= 1:
+                under_indexed.append(coll_name)
+            if stats["avg_obj_size"] > 1024 * 1024:  # > 1MB
+                large_documents.append(coll_name)
+        return under_indexed, large_documents
+    
+    def _calculate_health_score(self, metrics: DatabaseMetrics, slow_queries: Dict,
+                                flagged: Optional[Tuple[List[str], List[str]]] = None) -> int:
         """Calcula um score de saúde do banco (0-100)"""
         try:
+            under_indexed, large_documents = flagged or self._flag_collections(metrics)
+
             score = 100
             
             # Penaliza por consultas lentas
@@ -321,14 +457,10 @@ class MongoMonitor:
                 score -= 10
             
             # Penaliza por coleções sem índices adequados
-            for coll_name, stats in metrics.collection_stats.items():
-                if stats["count"] > 1000 and stats["index_count"] <= 1:
-                    score -= 5
+            score -= 5 * len(under_indexed)
             
             # Penaliza por documentos muito grandes
-            for coll_name, stats in metrics.collection_stats.items():
-                if stats["avg_obj_size"] > 1024 * 1024:  # > 1MB
-                    score -= 10
+            score -= 10 * len(large_documents)
             
             # Bonifica por uso adequado de índices
             if metrics.index_count > metrics.total_collections * 2:
@@ -339,33 +471,73 @@ class MongoMonitor:
         except Exception:
             return 50  # Score neutro em caso de erro
     
-    def monitor_real_time(self, interval_seconds: int = 30, duration_minutes: int = 10):
+    async def monitor_real_time(self, interval_seconds: int = 30, duration_minutes: int = 10):
         """Monitora métricas em tempo real"""
+        # Cliente assíncrono próprio do monitor: vários monitores podem
+        # compartilhar o mesmo event loop
+        from motor.motor_asyncio import AsyncIOMotorClient
+        
+        client = AsyncIOMotorClient(self.connection_string)
+        db = client[self.database_name]
         try:
-            end_time = datetime.now() + timedelta(minutes=duration_minutes)
+            deadline = time.monotonic() + duration_minutes * 60
             
             print(f"🔄 Monitoramento em tempo real por {duration_minutes} minutos")
             print(f"📊 Coletando métricas a cada {interval_seconds} segundos")
             print("=" * 80)
             
-            while datetime.now() < end_time:
-                metrics = self.collect_metrics()
-                if metrics:
-                    print(f"\n⏰ {metrics.timestamp.strftime('%H:%M:%S')}")
-                    print(f"📊 Documentos: {metrics.total_documents:,}")
-                    print(f"💾 Tamanho: {metrics.total_size_mb:.2f} MB")
-                    print(f"🔗 Conexões: {metrics.connections_current}")
-                    print(f"📈 Ops/seg: Q:{metrics.operations_per_second.get('query', 0)} "
-                          f"I:{metrics.operations_per_second.get('insert', 0)} "
-                          f"U:{metrics.operations_per_second.get('update', 0)} "
-                          f"D:{metrics.operations_per_second.get('delete', 0)}")
+            # Por tick: serverStatus filtrado + dbStats, em vez de N+2 comandos;
+            # ops/seg é a diferença dos opcounters entre dois ticks
+            previous_counters = None
+            previous_at = 0.0
+            while time.monotonic() < deadline:
+                server_status, db_stats = await asyncio.gather(
+                    client.admin.command(SERVER_STATUS_FIELDS),
+                    db.command("dbStats")
+                )
+                sampled_at = time.monotonic()
+                counters = server_status.get("opcounters", {})
+                if previous_counters is None:
+                    ops_per_second = dict.fromkeys(("query", "insert", "update", "delete"), 0)
+                else:
+                    elapsed = max(sampled_at - previous_at, 1e-9)
+                    ops_per_second = {
+                        op: round((counters.get(op, 0) - previous_counters.get(op, 0)) / elapsed, 1)
+                        for op in ("query", "insert", "update", "delete")
+                    }
+                previous_counters, previous_at = counters, sampled_at
                 
-                time.sleep(interval_seconds)
+                # Um único write por tick
+                sys.stdout.write(
+                    f"\n⏰ {datetime.now(timezone.utc).strftime('%H:%M:%S')}\n"
+                    f"📊 Documentos: {db_stats.get('objects', 0):,}\n"
+                    f"💾 Tamanho: {db_stats.get('dataSize', 0) / (1024 * 1024):.2f} MB\n"
+                    f"🔗 Conexões: {server_status.get('connections', {}).get('current', 0)}\n"
+                    f"📈 Ops/seg: Q:{ops_per_second['query']} "
+                    f"I:{ops_per_second['insert']} "
+                    f"U:{ops_per_second['update']} "
+                    f"D:{ops_per_second['delete']}\n"
+                )
+                sys.stdout.flush()
+                
+                await asyncio.sleep(interval_seconds)
                 
-        except KeyboardInterrupt:
-            print("\n⏹️  Monitoramento interrompido pelo usuário")
         except Exception as e:
             logger.error(f"❌ Erro no monitoramento: {e}")
+        finally:
+            client.close()
+
+def _to_json(obj: Any) -> str:
+    """Formata métricas/relatórios como JSON indentado (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=str,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_DATACLASS
+        ).decode()
+    if is_dataclass(obj):
+        obj = obj.__dict__
+    return json.dumps(obj, indent=2, default=str)
 
 def main():
     """Função principal"""
@@ -423,25 +595,28 @@ def main():
         elif command == "metrics":
             metrics = monitor.collect_metrics()
             if metrics:
-                print(json.dumps(metrics.__dict__, indent=2, default=str))
+                print(_to_json(metrics))
         
         elif command == "slow-queries":
             minutes = int(sys.argv[2]) if len(sys.argv) > 2 else 5
             slow_queries = monitor.analyze_slow_queries(minutes)
-            print(json.dumps(slow_queries, indent=2, default=str))
+            print(_to_json(slow_queries))
         
         elif command == "index-usage":
             index_usage = monitor.get_index_usage()
-            print(json.dumps(index_usage, indent=2, default=str))
+            print(_to_json(index_usage))
         
         elif command == "report":
             report = monitor.generate_performance_report()
-            print(json.dumps(report, indent=2, default=str))
+            print(_to_json(report))
         
         elif command == "monitor":
             interval = int(sys.argv[2]) if len(sys.argv) > 2 else 30
             duration = int(sys.argv[3]) if len(sys.argv) > 3 else 10
-            monitor.monitor_real_time(interval, duration)
+            try:
+                asyncio.run(monitor.monitor_real_time(interval, duration))
+            except KeyboardInterrupt:
+                print("\n⏹️  Monitoramento interrompido pelo usuário")
         
         else:
             print(f"❌ Comando '{command}' não reconhecido")
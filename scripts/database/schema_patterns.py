@@ -0,0 +1,10 @@
+"""
+Padrões compartilhados pelos validadores $jsonSchema dos scripts de banco
+(mongo_manager.py e migrations.py instalam o mesmo texto no servidor)
+"""
+
+# CPF: 11 dígitos, sem pontuação
+CPF_PATTERN = r"^\d{11}$"
+
+# E-mail: validação mínima (algo@dominio.tld)
+EMAIL_PATTERN = r"^[^@]+@[^@]+\.[^@]+$"
@@ -68,6 +68,8 @@ install_dependencies() {
     # Lista de dependências necessárias
     DEPENDENCIES=(
         "pymongo>=4.5.0"
+        "motor>=3.3.0"
+        "orjson>=3.8.0"
         "python-dotenv>=1.0.0"
         "click>=8.0.0"
         "tabulate>=0.9.0"
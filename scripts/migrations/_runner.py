@@ -1,9 +1,18 @@
 """Async wrapper to run index creation at startup if enabled."""
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 from scripts.migrations import m0001_create_indexes as m0001  # type: ignore
 
+# Dedicated pool: index creation never competes with the loop's default executor
+_migrations_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mig")
+
+MIGRATIONS_TIMEOUT_SECONDS = 30.0
+
 
 async def ensure_indexes() -> None:
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, m0001.run)
+    loop = asyncio.get_running_loop()
+    await asyncio.wait_for(
+        loop.run_in_executor(_migrations_executor, m0001.run),
+        timeout=MIGRATIONS_TIMEOUT_SECONDS,
+    )
@@ -3,31 +3,56 @@ Idempotent script to create required indexes for performance and data integrity.
 Run this as part of startup (optional) or manually.
 """
 
-from pymongo import ASCENDING
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import ASCENDING, IndexModel
 from pymongo.mongo_client import MongoClient
 
 from src.config.settings import Settings
 
+# One createIndexes command per collection; collections are built in parallel
+INDEXES = {
+    # Clientes: unique CPF and email (if present), and name for search
+    "clientes": [
+        IndexModel([("cpf", ASCENDING)], name="uniq_cpf", unique=True),
+        IndexModel([("email", ASCENDING)], name="uniq_email", unique=True, sparse=True),
+        IndexModel([("nome", ASCENDING)], name="idx_nome"),
+    ],
+    # Dívidas: open debts of a cliente by vencimento (ESR), plus status and vencimento.
+    # The compound index also serves cliente_id-only queries (prefix).
+    "dividas": [
+        IndexModel(
+            [("cliente_id", ASCENDING), ("status", ASCENDING), ("data_vencimento", ASCENDING)],
+            name="idx_dividas_cliente_status_vencimento",
+        ),
+        IndexModel([("status", ASCENDING)], name="idx_dividas_status"),
+        IndexModel([("data_vencimento", ASCENDING)], name="idx_dividas_vencimento"),
+    ],
+    # Boletos: same access pattern as dívidas
+    "boletos": [
+        IndexModel(
+            [("cliente_id", ASCENDING), ("status", ASCENDING), ("data_vencimento", ASCENDING)],
+            name="idx_boletos_cliente_status_vencimento",
+        ),
+        IndexModel([("status", ASCENDING)], name="idx_boletos_status"),
+        IndexModel([("data_vencimento", ASCENDING)], name="idx_boletos_vencimento"),
+    ],
+}
+
 
 def run() -> None:
     settings = Settings()
     client = MongoClient(settings.MONGO_URI)
-    db = client[settings.MONGO_DB_NAME]
-
-    # Clientes: unique CPF and email (if present), and name for search
-    db.clientes.create_index([("cpf", ASCENDING)], name="uniq_cpf", unique=True)
-    db.clientes.create_index([("email", ASCENDING)], name="uniq_email", unique=True, sparse=True)
-    db.clientes.create_index([("nome", ASCENDING)], name="idx_nome")
-
-    # Dívidas: by cliente, status, and vencimento
-    db.dividas.create_index([("cliente_id", ASCENDING)], name="idx_dividas_cliente")
-    db.dividas.create_index([("status", ASCENDING)], name="idx_dividas_status")
-    db.dividas.create_index([("data_vencimento", ASCENDING)], name="idx_dividas_vencimento")
-
-    # Boletos: by cliente, status and vencimento
-    db.boletos.create_index([("cliente_id", ASCENDING)], name="idx_boletos_cliente")
-    db.boletos.create_index([("status", ASCENDING)], name="idx_boletos_status")
-    db.boletos.create_index([("data_vencimento", ASCENDING)], name="idx_boletos_vencimento")
+    try:
+        db = client[settings.MONGO_DB_NAME]
+        with ThreadPoolExecutor(max_workers=len(INDEXES)) as pool:
+            futures = [
+                pool.submit(db[name].create_indexes, models) for name, models in INDEXES.items()
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        client.close()
 
 
 if __name__ == "__main__":
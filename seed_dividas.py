@@ -0,0 +1,42 @@
+"""
+Montagem em BSON das dívidas de teste, compartilhada pelos scripts
+populate_test_data.py e populate_production_data.py
+"""
+import struct
+from datetime import datetime
+
+from bson import encode
+from bson.raw_bson import RawBSONDocument
+
+
+def template_divida(tipo, descricao, valor_original, valor_atual, status,
+                    juros_mes, multa, vencimento, criacao):
+    """Serializa os campos estáticos de uma dívida uma única vez em BSON"""
+    estaticos = encode({
+        "tipo": tipo,
+        "descricao": descricao,
+        "valor_original": valor_original,
+        "valor_atual": valor_atual,
+        "status": status,
+        "dias_atraso": max(0, -vencimento.days),
+        "juros_mes": juros_mes,
+        "multa": multa
+    })
+    return estaticos, vencimento, criacao
+
+
+def com_campos(template: bytes, campos: dict) -> RawBSONDocument:
+    """Anexa os campos dinâmicos ao template BSON sem re-serializar os estáticos"""
+    corpo = template[4:-1] + encode(campos)[4:-1]
+    return RawBSONDocument(struct.pack("<i", len(corpo) + 5) + corpo + b"\x00")
+
+
+def montar_divida(template: tuple, cliente_id, now: datetime) -> RawBSONDocument:
+    """Monta uma dívida de teste a partir do template e do instante da execução"""
+    estaticos, vencimento, criacao = template
+    return com_campos(estaticos, {
+        "cliente_id": cliente_id,
+        "data_vencimento": now + vencimento,
+        "created_at": now + criacao,
+        "updated_at": now
+    })
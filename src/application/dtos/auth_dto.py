@@ -7,7 +7,7 @@ from datetime import datetime
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LoginDTO:
     """DTO para login de usuário"""
 
@@ -15,7 +15,7 @@ class LoginDTO:
     password: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TokenDTO:
     """DTO para token de autenticação"""
 
@@ -27,14 +27,14 @@ class TokenDTO:
     username: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RefreshTokenDTO:
     """DTO para renovação de token"""
 
     refresh_token: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class UserInfoDTO:
     """DTO para informações do usuário autenticado"""
 
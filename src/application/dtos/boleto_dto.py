@@ -8,7 +8,7 @@ from decimal import Decimal
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BoletoDTO:
     """DTO para transferência de dados de Boleto"""
 
@@ -25,7 +25,7 @@ class BoletoDTO:
     qr_code_pix: Optional[str]
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class GerarBoletoDTO:
     """DTO para geração de boleto"""
 
@@ -34,7 +34,7 @@ class GerarBoletoDTO:
     instrucoes: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BaixarBoletoDTO:
     """DTO para download de boleto"""
 
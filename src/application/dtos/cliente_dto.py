@@ -6,8 +6,10 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+import orjson
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class ClienteDTO:
     """DTO para transferência de dados de Cliente"""
 
@@ -41,8 +43,18 @@ class ClienteDTO:
             "historico_interacoes": self.historico_interacoes,
         }
 
+    def to_json(self) -> bytes:
+        """
+        Serializa o DTO direto para JSON
+
+        Equivale a serializar to_dict(), exceto que datetimes aninhados em
+        historico_interacoes também viram strings ISO (to_dict os mantém
+        como datetime)
+        """
+        return orjson.dumps(self)
+
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CriarClienteDTO:
     """DTO para criação de Cliente"""
 
@@ -53,7 +65,7 @@ class CriarClienteDTO:
     endereco: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AtualizarClienteDTO:
     """DTO para atualização de Cliente"""
 
@@ -63,7 +75,7 @@ class AtualizarClienteDTO:
     endereco: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BuscarClienteDTO:
     """DTO para busca de Cliente"""
 
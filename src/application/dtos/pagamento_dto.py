@@ -8,7 +8,7 @@ from decimal import Decimal
 from typing import Optional
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class PagamentoDTO:
     """DTO para transferência de dados de Pagamento"""
 
@@ -23,7 +23,7 @@ class PagamentoDTO:
     comprovante_url: Optional[str]
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ProcessarPagamentoDTO:
     """DTO para processamento de pagamento"""
 
@@ -33,14 +33,14 @@ class ProcessarPagamentoDTO:
     dados_pagamento: dict
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ConsultarStatusPagamentoDTO:
     """DTO para consulta de status de pagamento"""
 
     pagamento_id: str
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StatusPagamentoDTO:
     """DTO para resposta de status de pagamento"""
 
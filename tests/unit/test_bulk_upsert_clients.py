@@ -0,0 +1,78 @@
+"""
+Testes unitários para o upsert em lote de clientes (scripts/database/mongo_manager.py)
+"""
+
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "scripts" / "database"))
+
+from mongo_manager import MongoCloudManager  # noqa: E402
+
+
+def _cliente(cpf: str, **extra) -> dict:
+    return {"cpf": cpf, "email": f"{cpf}@teste.com", "nome": "Cliente Teste", **extra}
+
+
+def _bulk_result(upserted: int = 0, matched: int = 0, modified: int = 0) -> MagicMock:
+    return MagicMock(upserted_count=upserted, matched_count=matched, modified_count=modified)
+
+
+@pytest.fixture
+def manager():
+    manager = MongoCloudManager("mongodb://localhost:27017")
+    manager.db = MagicMock()
+    return manager
+
+
+class TestBulkUpsertClients:
+    """Testes para MongoCloudManager.bulk_upsert_clients"""
+
+    def test_filtro_por_cpf_e_formato_do_update(self, manager):
+        """Testa o filtro {"cpf": ...} e o formato $set/$setOnInsert"""
+        criado_em = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        manager.db.clientes.bulk_write.return_value = _bulk_result(upserted=1)
+
+        manager.bulk_upsert_clients([_cliente("12345678909", _id="x", created_at=criado_em)])
+
+        ops = manager.db.clientes.bulk_write.call_args.args[0]
+        assert manager.db.clientes.bulk_write.call_args.kwargs == {"ordered": False}
+        assert len(ops) == 1
+        assert ops[0]._filter == {"cpf": "12345678909"}
+        assert ops[0]._upsert is True
+
+        update = ops[0]._doc
+        assert set(update) == {"$set", "$setOnInsert"}
+        assert update["$setOnInsert"] == {"created_at": criado_em}
+        assert "_id" not in update["$set"]
+        assert "created_at" not in update["$set"]
+        assert update["$set"]["cpf"] == "12345678909"
+        assert isinstance(update["$set"]["updated_at"], datetime)
+
+    def test_totais_somados_entre_lotes(self, manager):
+        """Testa a soma dos contadores de todos os lotes"""
+        manager.db.clientes.bulk_write.side_effect = [
+            _bulk_result(upserted=2),
+            _bulk_result(upserted=0, matched=1, modified=1),
+        ]
+        docs = [_cliente(f"{i:011d}") for i in range(3)]
+
+        totais = manager.bulk_upsert_clients(docs, batch=2)
+
+        assert manager.db.clientes.bulk_write.call_count == 2
+        assert totais == {"upserted": 2, "matched": 1, "modified": 1}
+
+    def test_cpf_invalido_nao_grava_o_lote(self, manager):
+        """Testa que um CPF inválido levanta ValueError sem escrever nada"""
+        docs = [_cliente("12345678909"), _cliente("123.456.789-09")]
+
+        with pytest.raises(ValueError):
+            manager.bulk_upsert_clients(docs)
+
+        manager.db.clientes.bulk_write.assert_not_called()
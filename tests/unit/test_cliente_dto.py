@@ -0,0 +1,54 @@
+"""
+Testes unitários para ClienteDTO
+"""
+
+from datetime import datetime, timezone
+
+import orjson
+
+from src.application.dtos.cliente_dto import ClienteDTO
+
+
+def _cliente_dto(**overrides) -> ClienteDTO:
+    dados = {
+        "id": "68ae767cf391fdfc1660d088",
+        "cpf": "12345678909",
+        "nome": "João Silva",
+        "email": "joao@teste.com",
+        "telefone": "11999999999",
+        "endereco": "Rua Teste, 123",
+        "data_cadastro": datetime(2024, 1, 15, 10, 30, 0, 123456, tzinfo=timezone.utc),
+        "data_atualizacao": None,
+        "ativo": True,
+        "dividas_ids": ["d1", "d2"],
+        "historico_interacoes": [{"tipo": "ligacao", "canal": "telefone"}],
+    }
+    dados.update(overrides)
+    return ClienteDTO(**dados)
+
+
+class TestClienteDTO:
+    """Testes para serialização do ClienteDTO"""
+
+    def test_to_json_igual_to_dict(self):
+        """Testa que to_json produz o mesmo conteúdo de to_dict"""
+        dto = _cliente_dto()
+        assert orjson.loads(dto.to_json()) == dto.to_dict()
+
+    def test_to_json_igual_to_dict_com_data_atualizacao(self):
+        """Testa datas naive e com fuso no mesmo formato ISO de to_dict"""
+        dto = _cliente_dto(
+            data_cadastro=datetime(2024, 1, 15, 10, 30),
+            data_atualizacao=datetime(2024, 2, 1, 8, 0, tzinfo=timezone.utc),
+        )
+        assert orjson.loads(dto.to_json()) == dto.to_dict()
+
+    def test_to_json_datetime_aninhado_vira_iso(self):
+        """Testa que datetimes em historico_interacoes viram strings ISO"""
+        quando = datetime(2024, 3, 10, 14, 0, tzinfo=timezone.utc)
+        dto = _cliente_dto(historico_interacoes=[{"tipo": "email", "data": quando}])
+
+        historico = orjson.loads(dto.to_json())["historico_interacoes"]
+
+        assert historico == [{"tipo": "email", "data": quando.isoformat()}]
+        assert dto.to_dict()["historico_interacoes"][0]["data"] is quando